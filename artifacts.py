@@ -0,0 +1,67 @@
+import json
+import os
+import warnings
+import joblib
+import lightgbm as lgb
+import xgboost as xgb
+
+# trained models under models/, listed in models/index.json with the
+# feature columns they expect and whether those are scaled. LightGBM
+# models are stored as booster text, XGBoost boosters as json and any
+# other (sklearn) model with joblib
+
+model_dir = os.environ.get("F1_MODEL_DIR", "models")
+index_path = os.path.join(model_dir, "index.json")
+
+
+def load_index():
+    if not os.path.exists(index_path):
+        return {}
+    with open(index_path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_model(name, model, features, scaled):
+    os.makedirs(model_dir, exist_ok=True)
+    if isinstance(model, (lgb.LGBMModel, lgb.Booster)):
+        booster = model.booster_ if isinstance(model, lgb.LGBMModel) else model
+        path = os.path.join(model_dir, f"{name}.txt")
+        booster.save_model(path)
+        kind = "lightgbm"
+    elif isinstance(model, xgb.Booster):
+        path = os.path.join(model_dir, f"{name}.json")
+        model.save_model(path)
+        kind = "xgboost"
+    else:
+        path = os.path.join(model_dir, f"{name}.pkl")
+        joblib.dump(model, path)
+        kind = "sklearn"
+
+    index = load_index()
+    index[name] = {"path": path, "kind": kind, "features": list(features), "scaled": scaled}
+    tmp_path = f"{index_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(index, f, indent=1)
+    os.replace(tmp_path, index_path)
+    return path
+
+
+def load_model(name):
+    # returns (predict function on a float32 feature matrix, index entry)
+    entry = load_index()[name]
+    if entry["kind"] == "lightgbm":
+        booster = lgb.Booster(model_file=entry["path"])
+        return booster.predict, entry
+    if entry["kind"] == "xgboost":
+        booster = xgb.Booster()
+        booster.load_model(entry["path"])
+        booster.set_param({"nthread": 1})
+        return lambda X: booster.inplace_predict(X, validate_features=False), entry
+    model = joblib.load(entry["path"])
+
+    def predict(X):
+        # fitted on a DataFrame; the column order is the same
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", UserWarning)
+            return model.predict(X)
+    return predict, entry
@@ -0,0 +1,160 @@
+import argparse
+import os
+import numpy as np
+import pandas as pd
+import lightgbm as lgb
+import xgboost as xgb
+from joblib import Parallel, delayed
+import metrics
+import ranker
+import regression
+import scaling
+
+# walk-forward backtest: for every race k in the chosen range, train on all
+# races before k and predict k. rows are ordered by race, so each fold's
+# training set is a prefix of one shared feature matrix (a view, no copy),
+# and the matrices are memory-mapped into the worker processes once. the
+# regressors' features are standardized per fold with the mean and std of
+# that fold's training rows only, like scaling.py would have fitted them then
+
+feature_cols = ranker.feature_cols
+ranker_models = ["LightGBM Ranker", "XGBoost Ranker"]
+regression_models = list(regression.make_models()) + ["XGBoost"]
+
+
+def load():
+    encoded = ranker.load()
+    scaled = regression.load()
+    if not encoded["race_id"].astype(str).equals(scaled["race_id"].astype(str)):
+        raise ValueError("encoded_not_scaled and encoded_scaled rows are not aligned")
+    return encoded, scaled
+
+
+def race_bounds(race_ids):
+    # start offset of every race plus the end of the last one
+    race_ids = pd.Series(race_ids).astype(str).to_numpy()
+    starts = np.flatnonzero(np.r_[True, race_ids[1:] != race_ids[:-1]])
+    if len(np.unique(race_ids[starts])) != len(starts):
+        raise ValueError("rows of a race are not contiguous")
+    return race_ids[starts], np.r_[starts, len(race_ids)]
+
+
+def prefix_stats(X, cols):
+    # running count, sum and sum of squares of each column over the rows
+    # before i (row 0 is all zeros), nans left out like StandardScaler does.
+    # values are taken relative to the first row's, which doesn't change the
+    # std but keeps the sums small
+    values = X[:, cols].astype(np.float64)
+    shift = np.nan_to_num(values[0])
+    values -= shift
+    present = ~np.isnan(values)
+    values = np.where(present, values, 0.0)
+    zeros = np.zeros((1, len(cols)))
+    count, total, squares = (np.concatenate([zeros, np.cumsum(a, axis=0)])
+                             for a in (present.astype(np.float64), values, values * values))
+    return shift, count, total, squares
+
+
+def scale_prefix(X, cols, stats, train_end, test_end):
+    # rows up to test_end, standardized with the stats of the rows before train_end
+    shift, count, total, squares = stats
+    n = np.maximum(count[train_end], 1.0)
+    mean = total[train_end] / n
+    std = np.sqrt(np.maximum(squares[train_end] / n - mean * mean, 0.0))
+    std[std == 0] = 1.0
+    out = X[:test_end].astype(np.float64)
+    out[:, cols] = (out[:, cols] - shift - mean) / std
+    return out.astype(np.float32)
+
+
+def fit_predict(name, X_train, y_train, groups, X_test, threads):
+    # smaller prediction = better finishing position, for every model
+    if name == "LightGBM Ranker":
+        model = lgb.LGBMRanker(**{**ranker.lgb_params, "verbose": -1, "n_jobs": threads})
+        return model.fit(X_train, y_train, group=groups).predict(X_test)
+    if name == "XGBoost Ranker":
+        dtrain = xgb.DMatrix(X_train, label=y_train, nthread=threads)
+        dtrain.set_group(groups)
+        booster = xgb.train({**ranker.xgb_params, "nthread": threads}, dtrain,
+                            num_boost_round=ranker.num_boost_round)
+        return booster.predict(xgb.DMatrix(X_test, nthread=threads))
+    if name == "XGBoost":
+        dtrain = xgb.DMatrix(X_train, label=y_train, nthread=threads)
+        booster = xgb.train({**regression.xgb_params, "nthread": threads}, dtrain,
+                            num_boost_round=regression.num_boost_round)
+        return booster.predict(xgb.DMatrix(X_test, nthread=threads))
+    model = regression.make_models()[name]
+    if name == "LightGBM":
+        model.set_params(verbose=-1, n_jobs=threads)
+    return model.fit(X_train, y_train).predict(X_test)
+
+
+def run_fold(k, bounds, X_rank, scaled_cols, stats, rank_label, relative_finish, models, threads):
+    train_end, test_end = bounds[k], bounds[k + 1]
+    groups = np.diff(bounds[:k + 1])
+    X_scaled = None
+    predictions = {}
+    for name in models:
+        if name in ranker_models:
+            X, y = X_rank, rank_label
+        else:
+            if X_scaled is None:
+                X_scaled = scale_prefix(X_rank, scaled_cols, stats, train_end, test_end)
+            X, y = X_scaled, relative_finish
+        predictions[name] = fit_predict(name, X[:train_end], y[:train_end], groups, X[train_end:test_end], threads)
+    return predictions
+
+
+def backtest(encoded, scaled, first, last, models=None, jobs=-1):
+    # first/last are race_ids; returns one row per (race, model) with the
+    # metrics from metrics.py, scored for all folds at once
+    models = models or ranker_models + regression_models
+    races, bounds = race_bounds(encoded["race_id"])
+    order = races.tolist()
+    for race in (first, last):
+        if race not in order:
+            raise ValueError(f"unknown race {race}")
+    # the first race has nothing to train on
+    folds = range(max(order.index(first), 1), order.index(last) + 1)
+
+    X_rank = encoded[feature_cols].to_numpy(np.float32, na_value=np.nan)
+    scaled_cols = [feature_cols.index(col) for col in scaling.scale_cols if col in feature_cols]
+    stats = prefix_stats(X_rank, scaled_cols)
+    rank_label = (encoded.groupby("race_id", observed=True, sort=False)["relative_finish"]
+                  .rank(method="first").to_numpy(np.int32))
+    relative_finish = scaled["relative_finish"].to_numpy(np.float32)
+
+    jobs = os.cpu_count() if jobs == -1 else jobs
+    threads = max(1, (os.cpu_count() or 1) // jobs)
+    out = Parallel(n_jobs=jobs, max_nbytes=0)(
+        delayed(run_fold)(k, bounds, X_rank, scaled_cols, stats, rank_label, relative_finish, models, threads)
+        for k in folds)
+
+    rows = np.concatenate([np.arange(bounds[k], bounds[k + 1]) for k in folds])
+    predictions = {name: np.concatenate([fold[name] for fold in out]) for name in models}
+    report = metrics.evaluate(encoded["race_id"].to_numpy()[rows], rank_label[rows], predictions)
+    report.insert(1, "train_races", report["race_id"].map({races[k]: k for k in folds}))
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--first", help="first race_id to predict")
+    parser.add_argument("--last", help="last race_id to predict")
+    parser.add_argument("--races", type=int, default=ranker.n_test,
+                        help="without --first, predict this many of the most recent races")
+    parser.add_argument("--models", nargs="+", choices=ranker_models + regression_models)
+    parser.add_argument("--jobs", type=int, default=-1, help="parallel folds, -1 for one per core")
+    parser.add_argument("--out", help="also write the per-race report to this csv")
+    args = parser.parse_args()
+
+    encoded, scaled = load()
+    races, _ = race_bounds(encoded["race_id"])
+    first = args.first or races[-args.races]
+    last = args.last or races[-1]
+    report = backtest(encoded, scaled, first, last, args.models, args.jobs)
+
+    print(report.pivot(index="race_id", columns="model", values="correct").to_string())
+    print(metrics.summary(report).to_string())
+    if args.out:
+        report.to_csv(args.out, index=False)
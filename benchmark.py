@@ -0,0 +1,210 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+import warnings
+import numpy as np
+import sessions
+import pipeline
+import ranker
+import regression
+import schema
+import synthetic
+
+def time_call(fn, *args):
+    t0 = time.perf_counter()
+    out = fn(*args)
+    return out, time.perf_counter() - t0
+
+def bench_ingest(fixture_dir, years, workers=1):
+    # replays recorded sessions from fixture_dir inside a scratch directory,
+    # so neither datasets/ nor the real summary cache are touched
+    fixture_dir = os.path.abspath(fixture_dir)
+    work_dir = tempfile.mkdtemp(prefix="f1_bench_")
+    cwd = os.getcwd()
+    sessions.replay_dir = fixture_dir
+    sessions.summary_dir = os.path.join(work_dir, "summaries")
+    os.chdir(work_dir)
+    try:
+        # imported here, so getData's fastf1 cache goes to the scratch directory
+        # and the other benchmarks don't need it
+        import getData
+
+        # per round and per session type, cold summary cache
+        rounds = []
+        session_times = {stype: [] for stype in sessions.session_types}
+        for year in years:
+            for rnd in range(1, getData.race_counts[year]+1):
+                loaded = {}
+                for stype in sessions.session_types:
+                    loaded[stype], elapsed = time_call(sessions.load_summary, year, rnd, stype)
+                    if loaded[stype] is not None:
+                        session_times[stype].append(elapsed)
+                if loaded['R'] is None:
+                    continue
+                race_id = f"{year%100}-{rnd:02d}"
+                _, extract = time_call(getData.extract_race_frame, race_id, loaded['R'], loaded['FP1'],
+                                       loaded['FP2'], loaded['FP3'], loaded['Q'], loaded['S'])
+                load = sum(session_times[stype][-1] for stype in sessions.session_types if loaded[stype] is not None)
+                rounds.append({"race_id": race_id, "load": load, "extract": extract})
+
+        # whole build_years, first from warm summaries, then cold
+        _, warm = time_call(getData.build_years, years, workers)
+        shutil.rmtree(sessions.summary_dir)
+        _, cold = time_call(getData.build_years, years, workers)
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    return {
+        "years": years,
+        "workers": workers,
+        "build_cold": cold,
+        "build_warm": warm,
+        "rounds": rounds,
+        "sessions": {stype: {"count": len(times),
+                             "mean": float(np.mean(times)) if times else None,
+                             "total": float(np.sum(times))}
+                     for stype, times in session_times.items()},
+    }
+
+def print_ingest(report):
+    print(f"\nbuild_years {report['years']} with {report['workers']} worker(s): "
+          f"cold {report['build_cold']:.2f}s, warm {report['build_warm']:.2f}s")
+    print(f"\n{'session':<8}{'count':>7}{'mean ms':>10}{'total s':>10}")
+    for stype, stats in report["sessions"].items():
+        mean = f"{stats['mean']*1000:.1f}" if stats["mean"] is not None else "-"
+        print(f"{stype:<8}{stats['count']:>7}{mean:>10}{stats['total']:>10.2f}")
+    print(f"\n{'race':<8}{'load ms':>10}{'extract ms':>12}")
+    for row in report["rounds"]:
+        print(f"{row['race_id']:<8}{row['load']*1000:>10.1f}{row['extract']*1000:>12.1f}")
+
+# stages after ingestion, run in memory on synthetic seasons. each takes the
+# outputs so far and returns (output name, frame or result)
+stage_names = ["impute", "encode", "scale", "ranker", "regression"]
+stage_inputs = {"impute": "merged", "encode": "impute", "scale": "encode", "ranker": "encode", "regression": "scale"}
+baseline_path = "benchmarks/baseline.json"
+
+def run_stage(name, outputs):
+    config = {**pipeline.default_config}
+    if name == "impute":
+        return pipeline.impute(config, {"df": outputs["merged"]})["df"]
+    if name == "encode":
+        return pipeline.encode(config, {"df": outputs["impute"]})["df"]
+    if name == "scale":
+        return pipeline.scale(config, {"df": outputs["encode"]})["df"]
+    # the model scripts print their training logs; keep the report readable
+    with contextlib.redirect_stdout(io.StringIO()), warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        if name == "ranker":
+            return ranker.train(schema.apply(outputs["encode"], "encoded_not_scaled"))[1]
+        return regression.train(schema.apply(outputs["scale"], "encoded_scaled"))[1]
+
+def peak_memory(fn, *args):
+    # python-level peak (numpy and pandas buffers included), not the native
+    # allocations inside LightGBM/XGBoost
+    tracemalloc.start()
+    try:
+        out = fn(*args)
+        return out, tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def bench_stages(scales, stages=stage_names, memory=True, seed=0):
+    report = {}
+    for scale in scales:
+        outputs = {"merged": synthetic.generate(scale, seed=seed)}
+        results = {}
+        for name in stage_names:
+            # stages that weren't asked for still run, untimed, to feed later ones
+            if name not in stages:
+                if any(later in stages for later in stage_names[stage_names.index(name)+1:]):
+                    outputs[name] = run_stage(name, outputs)
+                continue
+            rows_in = len(outputs[stage_inputs[name]])
+            outputs[name], elapsed = time_call(run_stage, name, outputs)
+            peak = peak_memory(run_stage, name, outputs)[1] if memory else None
+            results[name] = {"time": elapsed, "peak_mb": peak / 2**20 if memory else None,
+                             "rows_in": rows_in, "rows_out": len(outputs[name])}
+        report[str(scale)] = results
+    return report
+
+def compare(report, baseline, tolerance=0.25, min_time=0.05):
+    # (scale, stage, metric, baseline, now) for everything that got slower or
+    # bigger than baseline * (1 + tolerance); very short stages are skipped
+    regressions = []
+    for scale, results in report.items():
+        for stage, now in results.items():
+            before = baseline.get(scale, {}).get(stage)
+            if before is None:
+                continue
+            if before["time"] >= min_time and now["time"] > before["time"] * (1 + tolerance):
+                regressions.append((scale, stage, "time", before["time"], now["time"]))
+            if None not in (before["peak_mb"], now["peak_mb"]) and now["peak_mb"] > before["peak_mb"] * (1 + tolerance):
+                regressions.append((scale, stage, "peak_mb", before["peak_mb"], now["peak_mb"]))
+    return regressions
+
+def print_stages(report, baseline=None):
+    baseline = baseline or {}
+    print(f"\n{'scale':>6}  {'stage':<11}{'rows in':>9}{'rows out':>9}{'time s':>9}{'base s':>9}{'peak MB':>9}{'base MB':>9}")
+    for scale, results in report.items():
+        for stage, r in results.items():
+            base = baseline.get(scale, {}).get(stage, {})
+            fmt = lambda v, spec: format(v, spec) if v is not None else "-"
+            print(f"{scale:>6}  {stage:<11}{r['rows_in']:>9}{r['rows_out']:>9}{r['time']:>9.2f}"
+                  f"{fmt(base.get('time'), '.2f'):>9}{fmt(r['peak_mb'], '.1f'):>9}{fmt(base.get('peak_mb'), '.1f'):>9}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("benchmark", choices=["ingest", "stages"])
+    parser.add_argument("--fixtures", default="fixtures/replay")
+    parser.add_argument("--years", type=int, nargs="+", default=[2024])
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--scales", type=float, nargs="+", default=[1, 10],
+                        help="synthetic dataset sizes relative to the real one (stages); the "
+                             "regression stage's SVR makes 100 take a long time")
+    parser.add_argument("--stages", nargs="+", choices=stage_names, default=stage_names)
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc pass (stages)")
+    parser.add_argument("--baseline", default=baseline_path)
+    parser.add_argument("--save-baseline", action="store_true",
+                        help="store this run as the baseline instead of comparing against it")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="allowed slowdown or memory growth before a stage counts as a regression")
+    parser.add_argument("--json", help="also write the report to this file")
+    args = parser.parse_args()
+
+    if args.benchmark == "ingest":
+        report = bench_ingest(args.fixtures, args.years, args.workers)
+        print_ingest(report)
+    else:
+        report = bench_stages([s if s % 1 else int(s) for s in args.scales], args.stages, not args.no_memory)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=1)
+
+    if args.benchmark == "stages":
+        baseline = {}
+        if os.path.exists(args.baseline):
+            with open(args.baseline) as f:
+                baseline = json.load(f)
+        print_stages(report, None if args.save_baseline else baseline)
+        if args.save_baseline:
+            os.makedirs(os.path.dirname(args.baseline) or ".", exist_ok=True)
+            # merge, so saving one scale or stage keeps the others
+            for scale, results in report.items():
+                baseline.setdefault(scale, {}).update(results)
+            with open(args.baseline, "w") as f:
+                json.dump(baseline, f, indent=1)
+            print(f"\nbaseline saved to {args.baseline}")
+        else:
+            regressions = compare(report, baseline, args.tolerance)
+            for scale, stage, metric, before, now in regressions:
+                print(f"REGRESSION scale {scale} {stage} {metric}: {before:.2f} -> {now:.2f}")
+            if regressions:
+                sys.exit(1)
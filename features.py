@@ -0,0 +1,114 @@
+import numpy as np
+import pandas as pd
+
+# long-run laps are the ones between fastest + 1.5s and fastest + 4.0s
+long_run_window = (1.5, 4.0)
+
+def total_seconds(lap_times):
+    # same value as Timedelta.total_seconds() on each element (whole seconds
+    # plus microseconds / 1e6), so the batched results match per-driver ones
+    micros = lap_times // pd.Timedelta(microseconds=1)
+    return micros // 1_000_000 + (micros % 1_000_000) / 1_000_000
+
+def long_run_avgs(laps, window=long_run_window):
+    # mean long-run lap time per driver for a whole session in one pass
+    try:
+        if laps is None or laps.empty:
+            return pd.Series(dtype=float)
+        lap_secs = laps['LapTime'].dt.total_seconds()
+        fastest = total_seconds(laps['LapTime'].groupby(laps['Driver']).transform('min'))
+        long_runs = laps[(lap_secs >= fastest + window[0]) &
+                         (lap_secs <= fastest + window[1])]
+        return total_seconds(long_runs.groupby('Driver')['LapTime'].mean())
+    except Exception:
+        return pd.Series(dtype=float)
+
+def race_paces(laps):
+    # mean lap time per driver over every lap of the session
+    try:
+        if laps is None or laps.empty:
+            return pd.Series(dtype=float)
+        return total_seconds(laps.groupby('Driver')['LapTime'].mean())
+    except Exception:
+        return pd.Series(dtype=float)
+
+def positions(results):
+    # classified position per driver code, only for drivers that have one
+    try:
+        if results is None or results.empty:
+            return {}
+        first = results.drop_duplicates('Abbreviation').dropna(subset=['Position'])
+        return {code: int(pos) for code, pos in zip(first['Abbreviation'], first['Position'])}
+    except Exception:
+        return {}
+
+def lookup(values, drv_codes):
+    return [values.get(code, np.nan) for code in drv_codes]
+
+# stint features: racing laps slower than the driver's median clean lap by
+# more than slow_lap_factor (safety cars, traffic, spins) don't count towards
+# degradation, and stints with fewer clean laps than min_stint_laps get no slope
+slow_lap_factor = 1.05
+min_stint_laps = 5
+stint_cols = ["deg", "stint_length", "stops", "pit_loss"]
+
+def stint_features(laps, slow_lap_factor=slow_lap_factor, min_stint_laps=min_stint_laps):
+    # per-driver stint features for a whole session, from one grouped pass
+    # over (driver, stint):
+    #   deg           least-squares lap-time slope within each stint (s/lap),
+    #                 averaged over the stints weighted by their clean laps;
+    #                 includes the fuel burn-off, so it reads lower than the
+    #                 tyres' own degradation
+    #   stint_length  mean laps per stint
+    #   stops         stints - 1
+    #   pit_loss      mean time an in-lap + out-lap pair costs over two
+    #                 median clean laps; only timed in-laps followed by an
+    #                 out-lap count, so pit-lane starts and retirements into
+    #                 the pits are left out
+    # summaries cached before the stint columns were kept give an empty frame
+    empty = pd.DataFrame(columns=stint_cols, dtype=float)
+    try:
+        if laps is None or laps.empty or not {'Stint', 'LapNumber', 'PitInTime', 'PitOutTime'} <= set(laps.columns):
+            return empty
+        laps = laps[laps['Stint'].notna() & laps['LapNumber'].notna()]
+        secs = laps['LapTime'].dt.total_seconds()
+        pit = laps['PitInTime'].notna() | laps['PitOutTime'].notna()
+        driver_median = secs.where(~pit).groupby(laps['Driver'], sort=False).median()
+        clean = ~pit & secs.notna() & (secs <= laps['Driver'].map(driver_median) * slow_lap_factor)
+
+        x = laps['LapNumber'].astype(float).where(clean, 0.0)
+        y = secs.where(clean, 0.0)
+        parts = pd.DataFrame({
+            'n': clean.astype(float), 'x': x, 'y': y, 'xy': x * y, 'xx': x * x,
+            'laps': 1.0,
+        })
+        per_stint = parts.groupby([laps['Driver'].rename('driver'), laps['Stint'].rename('stint')], sort=False).sum()
+
+        n = per_stint['n']
+        denom = n * per_stint['xx'] - per_stint['x'] ** 2
+        slope = ((n * per_stint['xy'] - per_stint['x'] * per_stint['y']) / denom.where(denom > 0))
+        weight = n.where(slope.notna() & (n >= min_stint_laps), 0.0)
+
+        drivers = per_stint.groupby(level='driver', sort=False)
+        stops = drivers.size() - 1
+
+        # a stop is an in-lap whose driver's next lap is an out-lap
+        ordered = laps.sort_values(['Driver', 'LapNumber'], kind='stable')
+        ordered_secs = secs.loc[ordered.index]
+        next_lap = ordered.groupby('Driver', sort=False)[['LapNumber', 'PitOutTime']].shift(-1)
+        next_secs = ordered_secs.groupby(ordered['Driver'], sort=False).shift(-1)
+        stop = (ordered['PitInTime'].notna() & next_lap['PitOutTime'].notna()
+                & (next_lap['LapNumber'] == ordered['LapNumber'] + 1)
+                & ordered_secs.notna() & next_secs.notna())
+        stop_secs = (ordered_secs + next_secs)[stop].groupby(ordered.loc[stop, 'Driver'], sort=False)
+        timed_stops = stop_secs.size().reindex(stops.index, fill_value=0)
+        pit_excess = stop_secs.sum().reindex(stops.index) - 2 * timed_stops * driver_median.reindex(stops.index)
+        weights = weight.groupby(level='driver', sort=False).sum()
+        return pd.DataFrame({
+            'deg': (slope.fillna(0.0) * weight).groupby(level='driver', sort=False).sum() / weights.where(weights > 0),
+            'stint_length': drivers['laps'].mean(),
+            'stops': stops.astype(float),
+            'pit_loss': pit_excess / timed_stops.where(timed_stops > 0),
+        })[stint_cols]
+    except Exception:
+        return empty
@@ -1,8 +1,25 @@
+import argparse
+import asyncio
+import io
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 import fastf1
 import numpy as np
 import pandas as pd
 from pathlib import Path
+from features import long_run_avgs, race_paces, positions, lookup, long_run_window, stint_features
+from sessions import entrants, load_weekend, session_types
+import instrument
+import lapstore
+import storage
+import rolling
+import schema
 
+# fastf1 refuses a cache folder that doesn't exist yet
+Path('cache').mkdir(exist_ok=True)
 fastf1.Cache.enable_cache('cache')
 
 # fll calendar sizes (scheduled rounds, not actual run races)
@@ -12,17 +29,6 @@ race_counts = {
     2024: 24, 2025: 24
 }
 
-def compute_long_run_avg(laps):
-    try:
-        if laps is None or laps.empty:
-            return np.nan
-        fastest = laps['LapTime'].min().total_seconds()
-        long_runs = laps[(laps['LapTime'].dt.total_seconds() >= fastest + 1.5) &
-                         (laps['LapTime'].dt.total_seconds() <= fastest + 4.0)]
-        return long_runs['LapTime'].mean().total_seconds() if not long_runs.empty else np.nan
-    except Exception:
-        return np.nan
-
 def safe_weather(session):
     try:
         if session is None:
@@ -32,163 +38,368 @@ def safe_weather(session):
     except Exception:
         return "unknown"
 
-def safe_position(driver_row):
-    try:
-        if driver_row is not None and not driver_row.empty and pd.notna(driver_row['Position'].iloc[0]):
-            return int(driver_row['Position'].iloc[0])
-        else:
-            return np.nan
-    except Exception:
-        return np.nan
-
-def build_year(year):
-    Path("datasets").mkdir(exist_ok=True)
-    file_path = f"datasets/f1_{year}_all_drivers.csv"
-    open(file_path, 'w').close()  # clear file
+def fetch_round(year, rnd, window=long_run_window, concurrency=3, retries=3):
+    # everything for one round except the rolling performance indices, which
+    # depend on earlier rounds and are filled in by replay_standings.
+    # returns (df_race, standings, failures); df_race is None when the race
+    # is skipped and failures maps each session that didn't load to the reason
+    race_id = f"{year%100}-{rnd:02d}"
+    print(f"Processing {year} Round {rnd}...")
     
-    driver_points_hist = {}
-    team_points_hist = {}
-    
-    for rnd in range(1, race_counts[year]+1):
-        race_id = f"{year%100}-{rnd:02d}"
-        print(f"Processing {year} Round {rnd}...")
+    with instrument.span("round", race_id=race_id) as record:
+        t0 = time.perf_counter()
+        loaded, failures = asyncio.run(load_weekend(year, rnd, session_types, concurrency, retries))
+        record["load_seconds"] = round(time.perf_counter() - t0, 6)
+        record["failures"] = failures
+        for stype, reason in failures.items():
+            print(f"{race_id} {stype} not loaded ({reason})")
         
-        try:
-            race = fastf1.get_session(year, rnd, 'R')
-            race.load()
-        except Exception:
+        # every loaded session's laps go to the lap archive, for recompute_laps
+        t0 = time.perf_counter()
+        lapstore.write_weekend(year, rnd, loaded)
+        record["archive_seconds"] = round(time.perf_counter() - t0, 6)
+        
+        race = loaded['R']
+        if race is None:
             print(f"Skipping {race_id} (race not available)")
-            continue   # skip this race only
+            record["skipped"] = "race not available"
+            return None, None, failures   # skip this race only
         
         # Try to get results and laps safely
         try:
-            race_results = race.results
+            race.results
         except Exception:
             print(f"Skipping {race_id} (no results)")
-            continue   # skip this race only
+            record["skipped"] = "no results"
+            return None, None, failures   # skip this race only
         try:
-            race_laps = race.laps
+            race.laps
         except Exception:
             print(f"Skipping {race_id} (no laps)")
-            continue   # skip this race only
-        
-        track_type = race.event.get('EventName', "unknown")
-        race_weather = safe_weather(race)
-        drivers = getattr(race, "drivers", [])
+            record["skipped"] = "no laps"
+            return None, None, failures   # skip this race only
         
+        t0 = time.perf_counter()
+        df_race, standings = extract_race_frame(race_id, race, loaded['FP1'], loaded['FP2'], loaded['FP3'],
+                                                loaded['Q'], loaded['S'], window)
+        record["extract_seconds"] = round(time.perf_counter() - t0, 6)
+        record["rows_out"] = len(df_race)
+        return df_race, standings, failures
+
+def extract_race_frame(race_id, race, fp1, fp2, fp3, quali, sprint, window=long_run_window):
+    # whole-race frame in one pass per session instead of per-driver filtering;
+    # the performance indices are filled in later by replay_standings
+    race_results = race.results
+    drv_codes, team_names = entrants(race)
+    n = len(drv_codes)
+    
+    no_stints = stint_features(None)
+    
+    # FP1
+    try:
+        fp1_avg = long_run_avgs(fp1.laps, window) if fp1 else {}
+        fp1_stints = stint_features(fp1.laps) if fp1 else no_stints
+        fp1_weather = safe_weather(fp1)
+    except Exception:
+        fp1_avg, fp1_stints, fp1_weather = {}, no_stints, "unknown"
+    
+    # FP2 / Sprint
+    fp2_avg, fp2_stints, fp2_weather = {}, no_stints, np.nan
+    fp3_avg, fp3_stints, fp3_weather = {}, no_stints, np.nan
+    try:
+        if race.event.get("EventFormat", "") == 'sprint':
+            fp3_avg = long_run_avgs(sprint.laps, window) if sprint else {}
+            fp3_stints = stint_features(sprint.laps) if sprint else no_stints
+            fp3_weather = safe_weather(sprint)
+        else:
+            fp2_avg = long_run_avgs(fp2.laps, window) if fp2 else {}
+            fp2_stints = stint_features(fp2.laps) if fp2 else no_stints
+            fp2_weather = safe_weather(fp2)
+            fp3_avg = long_run_avgs(fp3.laps, window) if fp3 else {}
+            fp3_stints = stint_features(fp3.laps) if fp3 else no_stints
+            fp3_weather = safe_weather(fp3)
+    except Exception:
+        pass
+    
+    # Qualifying
+    try:
+        quali_pos = positions(quali.results) if quali else {}
+        quali_weather = safe_weather(quali)
+    except Exception:
+        quali_pos, quali_weather = {}, "unknown"
+    
+    # Race pace + finishing position
+    try:
+        race_pace = race_paces(race.laps)
+        race_stints = stint_features(race.laps)
+    except Exception:
+        race_pace, race_stints = {}, no_stints
+    finish_pos = positions(race_results)
+    
+    df_race = pd.DataFrame({
+        "race_id": [race_id] * n,
+        "fp1_long_run": lookup(fp1_avg, drv_codes), "fp1_weather": [fp1_weather] * n,
+        "fp2_long_run": lookup(fp2_avg, drv_codes), "fp2_weather": [fp2_weather] * n,
+        "fp3_long_run": lookup(fp3_avg, drv_codes), "fp3_weather": [fp3_weather] * n,
+        "qualifying": lookup(quali_pos, drv_codes), "qualifying_weather": [quali_weather] * n,
+        "driver_perf": [0.0] * n, "team_perf": [0.0] * n,
+        "track_type": [race.event.get('EventName', "unknown")] * n,
+        "race_weather": [safe_weather(race)] * n,
+        "race_pace": lookup(race_pace, drv_codes),
+        "finishing_position": lookup(finish_pos, drv_codes),
+        "fp1_deg": lookup(fp1_stints["deg"], drv_codes),
+        "fp2_deg": lookup(fp2_stints["deg"], drv_codes),
+        "fp3_deg": lookup(fp3_stints["deg"], drv_codes),
+        "race_deg": lookup(race_stints["deg"], drv_codes),
+        "race_stint_length": lookup(race_stints["stint_length"], drv_codes),
+        "race_stops": lookup(race_stints["stops"], drv_codes),
+        "race_pit_loss": lookup(race_stints["pit_loss"], drv_codes),
+    }, columns=schema.raw_columns)
+    
+    # Points scored this round (None when the driver has no result row)
+    try:
+        first = race_results.drop_duplicates('Abbreviation').set_index('Abbreviation')['Points']
+    except Exception:
+        first = {}
+    standings = [(drv_code, team_name, first[drv_code] if drv_code in first else None)
+                 for drv_code, team_name in zip(drv_codes, team_names)]
+    
+    return df_race, standings
+
+def replay_standings(standings, form):
+    # indices every driver of the round sees, then fold the round into the form
+    driver_perfs = [form.driver_perf(drv_code) for drv_code, _, _ in standings]
+    team_perfs = [form.team_perf(team_name) for _, team_name, _ in standings]
+    form.update(standings)
+    return driver_perfs, team_perfs
+
+def manifest_standings(entries):
+    # older manifests also stored the team total as a fourth field
+    return [tuple(entry[:3]) for entry in entries]
+
+def year_paths(year):
+    return f"datasets/f1_{year}_all_drivers.csv", f"datasets/f1_{year}_manifest.json"
+
+def atomic_write(path, text):
+    # write to a temp file next to the target and swap it in, so a killed
+    # run leaves either the old or the new file but never a partial one
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+def load_manifest(year):
+    # manifest maps race_id -> standings for every round already in the csv,
+    # which is what the rolling form is restored from
+    file_path, manifest_path = year_paths(year)
+    if not (os.path.exists(file_path) and os.path.exists(manifest_path)):
+        return {}
+    with open(manifest_path, encoding='utf-8') as f:
+        manifest = json.load(f)["rounds"]
+    
+    # drop rounds the csv doesn't have and csv rows the manifest doesn't know,
+    # e.g. when a run died between the two writes
+    with open(file_path, encoding='utf-8') as f:
+        lines = f.readlines()
+    header, rows = lines[:1], lines[1:]
+    present = {line.split(',', 1)[0] for line in rows}
+    manifest = {race_id: standings for race_id, standings in manifest.items() if race_id in present}
+    kept = [line for line in rows if line.split(',', 1)[0] in manifest]
+    if len(kept) != len(rows):
+        atomic_write(file_path, ''.join(header + kept) if kept else '')
+    return manifest
+
+def load_failures(year):
+    # race_id -> {session: reason} for sessions that didn't load
+    _, manifest_path = year_paths(year)
+    if not os.path.exists(manifest_path):
+        return {}
+    with open(manifest_path, encoding='utf-8') as f:
+        return json.load(f).get("failures", {})
+
+def save_manifest(year, manifest, failures=None):
+    _, manifest_path = year_paths(year)
+    atomic_write(manifest_path, json.dumps({"rounds": manifest, "failures": failures or {}}, indent=1))
+
+def append_round(year, df_race):
+    file_path, _ = year_paths(year)
+    existing = ''
+    if os.path.exists(file_path):
+        with open(file_path, encoding='utf-8') as f:
+            existing = f.read()
+    # a season stored before columns were added gets them, empty, so the
+    # file keeps a single header
+    if existing and existing.split('\n', 1)[0].split(',') != list(df_race.columns):
+        existing = pd.read_csv(io.StringIO(existing), float_precision='round_trip').reindex(columns=df_race.columns).to_csv(index=False)
+    chunk = df_race.to_csv(header=not existing, index=False)
+    atomic_write(file_path, existing + chunk)
+
+def fetch_rounds(tasks, workers=1, window=long_run_window, concurrency=3, retries=3):
+    # fetch [(year, rnd), ...] with a process pool when workers > 1.
+    # yields results in task order as soon as each prefix is ready, whatever
+    # order the workers finish in
+    years = [year for year, _ in tasks]
+    rnds = [rnd for _, rnd in tasks]
+    fetch = partial(fetch_round, window=window, concurrency=concurrency, retries=retries)
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            yield from zip(tasks, pool.map(fetch, years, rnds))
+    else:
+        yield from zip(tasks, map(fetch, years, rnds))
+
+def build_years(years, workers=1, incremental=False, window=long_run_window, form_window=rolling.form_window,
+                concurrency=3, retries=3):
+    # incremental mode keeps every round up to the last one recorded in the
+    # manifest and fetches the rounds after it, plus earlier rounds that
+    # aren't stored because their race failed; otherwise the year is rebuilt
+    # from scratch. either way each round is committed to the csv and
+    # manifest as soon as it is processed, so an interrupted run can resume
+    Path("datasets").mkdir(exist_ok=True)
+    tasks = []
+    state = {}
+    for year in years:
+        manifest = load_manifest(year) if incremental else {}
+        if incremental and not manifest:
+            print(f"No usable manifest for {year}, rebuilding the whole season")
+        if not manifest:
+            file_path, manifest_path = year_paths(year)
+            open(file_path, 'w').close()  # clear file
+            if os.path.exists(manifest_path):
+                os.remove(manifest_path)
         
-        def load_session(stype):
-            try:
-                s = fastf1.get_session(year, rnd, stype)
-                s.load()
-                return s
-            except Exception:
-                return None
-        
-        fp1 = load_session('FP1')
-        fp2 = load_session('FP2')
-        fp3 = load_session('FP3')
-        quali = load_session('Q')
-        sprint = load_session('S')
+        # restore the rolling form from the stored rounds
+        form = rolling.RollingForm(form_window)
+        for race_id in sorted(manifest):
+            form.update(manifest_standings(manifest[race_id]))
+        state[year] = (manifest, form, load_failures(year) if manifest else {})
         
-        rows = []
-        for drv in drivers:
-            try:
-                drv_info = race.get_driver(drv)
-                drv_code = drv_info.get('Abbreviation', "UNK")
-                team_name = drv_info.get('TeamName', "UNK")
-            except Exception:
-                drv_code, team_name = "UNK", "UNK"
-            
-            row = [race_id]
-            
-            # FP1
-            try:
-                laps = fp1.laps.pick_driver(drv_code) if fp1 else None
-                fp1_avg = compute_long_run_avg(laps)
-                fp1_weather = safe_weather(fp1)
-            except Exception:
-                fp1_avg, fp1_weather = np.nan, "unknown"
-            row.extend([fp1_avg, fp1_weather])
-            
-            # FP2 / Sprint
-            fp2_avg, fp2_weather = np.nan, np.nan
-            fp3_avg, fp3_weather = np.nan, np.nan
-            try:
-                if race.event.get("EventFormat", "") == 'sprint':
-                    laps = sprint.laps.pick_driver(drv_code) if sprint else None
-                    fp3_avg = compute_long_run_avg(laps)
-                    fp3_weather = safe_weather(sprint)
-                else:
-                    laps = fp2.laps.pick_driver(drv_code) if fp2 else None
-                    fp2_avg = compute_long_run_avg(laps)
-                    fp2_weather = safe_weather(fp2)
-                    laps = fp3.laps.pick_driver(drv_code) if fp3 else None
-                    fp3_avg = compute_long_run_avg(laps)
-                    fp3_weather = safe_weather(fp3)
-            except Exception:
-                pass
-            row.extend([fp2_avg, fp2_weather, fp3_avg, fp3_weather])
-            
-            # Qualifying
-            try:
-                res = quali.results if quali else None
-                driver_row = res[res['Abbreviation'] == drv_code] if res is not None else None
-                quali_pos = safe_position(driver_row)
-                quali_weather = safe_weather(quali)
-            except Exception:
-                quali_pos, quali_weather = np.nan, "unknown"
-            row.extend([quali_pos, quali_weather])
-            
-            # Performance indices
-            d_hist = driver_points_hist.get(drv_code, [])
-            t_hist = team_points_hist.get(team_name, [])
-            driver_perf = sum(d_hist[-5:])/(len(d_hist[-5:])*25) if d_hist else 0.0
-            team_perf = sum(t_hist[-5:])/(len(t_hist[-5:])*43) if t_hist else 0.0
-            row.extend([driver_perf, team_perf])
-            
-            # Race pace + finishing position
-            try:
-                laps = race_laps.pick_driver(drv_code)
-                avg_race_pace = laps['LapTime'].mean().total_seconds() if not laps.empty else np.nan
-            except Exception:
-                avg_race_pace = np.nan
-            try:
-                driver_row = race_results[race_results['Abbreviation'] == drv_code]
-                finishing_pos = safe_position(driver_row)
-            except Exception:
-                finishing_pos = np.nan
-            row.extend([track_type, race_weather, avg_race_pace, finishing_pos])
-            
-            # Update rolling points
-            try:
-                driver_row = race_results[race_results['Abbreviation'] == drv_code]
-                if not driver_row.empty:
-                    pts = driver_row['Points'].iloc[0]
-                    driver_points_hist.setdefault(drv_code, []).append(pts)
-                    team_pts = race_results[race_results['TeamName'] == team_name]['Points'].sum()
-                    team_points_hist.setdefault(team_name, []).append(team_pts)
-            except Exception:
-                pass
+        last_done = max((int(race_id[-2:]) for race_id in manifest), default=0)
+        failed = sorted(int(race_id[-2:]) for race_id in state[year][2]
+                        if race_id not in manifest and int(race_id[-2:]) < last_done)
+        if failed:
+            print(f"Retrying {year} rounds {failed}")
+        tasks.extend((year, rnd) for rnd in failed + list(range(last_done+1, race_counts[year]+1)))
+        if last_done == race_counts[year] and not failed:
+            print(f"Year {year} already complete → {year_paths(year)[0]}")
+    
+    last_task = {year: rnd for year, rnd in tasks}
+    recovered = set()
+    for (year, rnd), (df_race, standings, round_failures) in fetch_rounds(tasks, workers, window,
+                                                                          concurrency, retries):
+        manifest, form, failures = state[year]
+        race_id = f"{year%100}-{rnd:02d}"
+        if df_race is not None and any(race_id < done for done in manifest):
+            # appended out of order; the csv is sorted and the form recomputed
+            # once the year's rounds are in
+            recovered.add(year)
+        if round_failures:
+            failures[race_id] = round_failures
+        else:
+            failures.pop(race_id, None)
+        if df_race is not None:
+            driver_perfs, team_perfs = replay_standings(standings, form)
+            df_race["driver_perf"] = driver_perfs
+            df_race["team_perf"] = team_perfs
             
-            rows.append(row)
-        
-        
-        df_race = pd.DataFrame(rows, columns=[
-            "race_id",
-            "fp1_long_run","fp1_weather",
-            "fp2_long_run","fp2_weather",
-            "fp3_long_run","fp3_weather",
-            "qualifying","qualifying_weather",
-            "driver_perf","team_perf",
-            "track_type","race_weather",
-            "race_pace","finishing_position"
-        ])
-        write_header = (rnd == 1)
-        df_race.to_csv(file_path, mode='a', header=write_header, index=False)
+            append_round(year, df_race)
+            manifest[race_id] = [
+                [drv_code, team_name, None if pts is None else float(pts)]
+                for drv_code, team_name, pts in standings
+            ]
+        save_manifest(year, manifest, failures)
+        if rnd == last_task[year]:
+            if year in recovered:
+                restore_order(year, form_window)
+            if storage.backend != "csv":
+                storage.write_dataset(pd.read_csv(year_paths(year)[0], float_precision='round_trip'), "all_drivers", seasons=[year])
+            print(f"Year {year} finished → {year_paths(year)[0]}")
     
-    print(f"Year {year} finished → {file_path}")
-    return file_path
+    return [year_paths(year)[0] for year in years]
+
+def build_year(year, workers=1, incremental=False, window=long_run_window, form_window=rolling.form_window,
+               concurrency=3, retries=3):
+    return build_years([year], workers, incremental, window, form_window, concurrency, retries)[0]
 
-for year in race_counts.keys():
-    build_year(year)
+def restore_order(year, form_window=rolling.form_window):
+    # rounds refetched after later ones were stored: put the csv back in race
+    # order and recompute the form every later round sees
+    file_path, _ = year_paths(year)
+    df = pd.read_csv(file_path, float_precision='round_trip')
+    atomic_write(file_path, df.sort_values("race_id", kind="stable").to_csv(index=False))
+    recompute_form([year], form_window)
+
+def recompute_form(years, form_window=rolling.form_window):
+    # rewrite driver_perf/team_perf of stored seasons from their manifests in
+    # one vectorized pass, e.g. after changing the form window
+    for year in years:
+        file_path, _ = year_paths(year)
+        manifest = load_manifest(year)
+        if not manifest:
+            print(f"No usable manifest for {year}, skipping")
+            continue
+        results = pd.DataFrame(
+            [(race_id, drv_code, team_name, np.nan if pts is None else pts, pts is not None)
+             for race_id in sorted(manifest)
+             for drv_code, team_name, pts in manifest_standings(manifest[race_id])],
+            columns=["race_id", "driver", "team", "points", "counted"])
+        df = pd.read_csv(file_path, float_precision='round_trip')
+        if not (df["race_id"].to_numpy() == results["race_id"].to_numpy()).all():
+            print(f"{file_path} doesn't line up with its manifest, skipping")
+            continue
+        df[["driver_perf", "team_perf"]] = rolling.compute_history(results, form_window).to_numpy()
+        atomic_write(file_path, df.to_csv(index=False))
+        print(f"Year {year} form recomputed → {file_path}")
+
+def recompute_laps(years, window=long_run_window):
+    # rewrite the long runs, race pace and stint features of stored seasons
+    # from the lap archive, e.g. after changing the long-run window, without
+    # loading anything from FastF1
+    for year in years:
+        file_path, _ = year_paths(year)
+        if not os.path.exists(file_path) or os.path.getsize(file_path) == 0:
+            print(f"No stored data for {year}, skipping")
+            continue
+        df = pd.read_csv(file_path, float_precision='round_trip').reindex(columns=schema.raw_columns)
+        rounds = [(year, int(race_id[-2:])) for race_id in df["race_id"].unique()]
+        laps = lapstore.recompute_rounds(rounds, window)
+        if len(laps) != len(df) or not (df["race_id"].to_numpy() == laps["race_id"].to_numpy()).all():
+            print(f"{file_path} doesn't line up with the lap archive, skipping")
+            continue
+        df[lapstore.lap_columns] = laps[lapstore.lap_columns].to_numpy()
+        atomic_write(file_path, df.to_csv(index=False))
+        if storage.backend != "csv":
+            storage.write_dataset(df, "all_drivers", seasons=[year])
+        print(f"Year {year} lap features recomputed → {file_path}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--years", type=int, nargs="+", default=list(race_counts.keys()))
+    parser.add_argument("--workers", type=int, default=1,
+                        help="processes used to fetch rounds across all selected seasons")
+    parser.add_argument("--incremental", action="store_true",
+                        help="only fetch rounds after the last one already stored for each season")
+    parser.add_argument("--long-run-window", type=float, nargs=2, default=list(long_run_window),
+                        help="seconds above a driver's fastest lap that count as long-run laps")
+    parser.add_argument("--form-window", type=int, default=rolling.form_window,
+                        help="races the driver/team performance indices look back over")
+    parser.add_argument("--session-concurrency", type=int, default=3,
+                        help="sessions of one weekend loaded at the same time")
+    parser.add_argument("--retries", type=int, default=3,
+                        help="retries for sessions that fail with a network error")
+    parser.add_argument("--recompute-form", action="store_true",
+                        help="only rewrite driver_perf/team_perf of stored seasons from their manifests")
+    parser.add_argument("--recompute-laps", action="store_true",
+                        help="only rewrite long runs, race pace and stint features of stored seasons "
+                             "from the lap archive (uses --long-run-window)")
+    parser.add_argument("--trace", help="append json-lines timings per round and session to this file")
+    args = parser.parse_args()
+    
+    if args.trace:
+        instrument.configure(trace=args.trace)
+    if args.recompute_form:
+        recompute_form(args.years, args.form_window)
+    elif args.recompute_laps:
+        recompute_laps(args.years, tuple(args.long_run_window))
+    else:
+        build_years(args.years, args.workers, args.incremental, tuple(args.long_run_window),
+                    args.form_window, args.session_concurrency, args.retries)
@@ -0,0 +1,258 @@
+import numpy as np
+import pandas as pd
+
+fp_cols = ["fp1_long_run", "fp2_long_run", "fp3_long_run"]
+
+def fill_from_own_sessions(df, cols=fp_cols):
+    # fill a missing long run with the mean of the driver's other sessions
+    # of the same weekend (row-wise nanmean)
+    known = df[cols]
+    counts = known.notna().sum(axis=1)
+    row_mean = known.sum(axis=1).where(counts > 0) / counts
+    for col in cols:
+        df[col] = df[col].fillna(row_mean)
+    return df
+
+def fill_from_teammates(df, cols=fp_cols, keys=("race_id", "team_perf")):
+    # fill rows with every long run missing using the mean of all known long
+    # runs of rows sharing the keys, i.e. the teammate in the same race
+    all_missing = df[cols].isna().all(axis=1)
+    known = df.loc[~all_missing, cols]
+    group_keys = [df.loc[~all_missing, key] for key in keys]
+    sums = known.sum(axis=1).groupby(group_keys, observed=True).sum()
+    counts = known.notna().sum(axis=1).groupby(group_keys, observed=True).sum()
+    group_mean = (sums / counts).rename("fill")
+
+    missing_keys = df.loc[all_missing, list(keys)]
+    fill = missing_keys.join(group_mean, on=list(keys))["fill"]
+    for col in cols:
+        df.loc[all_missing, col] = fill
+    return df
+
+
+def race_order(race_ids):
+    # chronological position of a race: "24-05" -> 24005. only the distinct
+    # race ids are parsed
+    codes, races = pd.factorize(pd.Series(race_ids, copy=False).astype(str))
+    orders = np.array([int(year) * 1000 + int(rnd) for year, rnd in (race.split("-", 1) for race in races)],
+                      dtype=np.int64)
+    return orders[codes]
+
+
+class NearestNeighbourImputer:
+    # fills a long run with the mean of the k rows with the closest team_perf
+    # among rows from that race or earlier ones only, so a race is imputed the
+    # same whatever came later. the candidates come from the same track with
+    # the same session weather; when fewer than k of those are earlier, from
+    # the same track in any weather, and then from any track. the known long
+    # runs are indexed once per pool as team_perf-sorted positions, and each
+    # batch of targets is one masked distance matrix against its pool
+
+    def __init__(self, k=5, cols=fp_cols, group_col="track_type", perf_col="team_perf"):
+        self.k = k
+        self.cols = cols
+        self.group_col = group_col
+        self.perf_col = perf_col
+        self.index = {}
+
+    @staticmethod
+    def weather_col(col):
+        return col.replace("_long_run", "_weather")
+
+    def pool_keys(self, col):
+        # narrowest pool first
+        return [[self.group_col, self.weather_col(col)], [self.group_col], []]
+
+    def fit(self, df):
+        self.index = {}
+        for col in self.cols:
+            known = df[df[col].notna()].sort_values(self.perf_col, kind="stable")
+            pools = [known.groupby(keys, observed=True, sort=False).indices if keys
+                     else {(): np.arange(len(known))}
+                     for keys in self.pool_keys(col)]
+            self.index[col] = (known[self.perf_col].to_numpy(dtype=float),
+                               known[col].to_numpy(dtype=float),
+                               race_order(known["race_id"]),
+                               pools)
+        return self
+
+    def nearest_mean(self, perf, values, orders, queries, query_orders, allow_fewer):
+        # mean of the k candidates closest to each query among those no later
+        # than its race; ties go to the lower team_perf. NaN where fewer than
+        # k qualify, unless allow_fewer (then NaN only where none do)
+        keep = orders <= query_orders.max()
+        perf, values, orders = perf[keep], values[keep], orders[keep]
+        eligible = orders[None, :] <= query_orders[:, None]
+        dist = np.where(eligible, np.abs(perf[None, :] - queries[:, None]), np.inf)
+        nearest = np.argsort(dist, axis=1, kind="stable")[:, :self.k]
+        counts = np.minimum(eligible.sum(axis=1), self.k)
+        taken = np.arange(nearest.shape[1])[None, :] < counts[:, None]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            means = np.where(taken, values[nearest], 0.0).sum(axis=1) / counts
+        enough = counts > 0 if allow_fewer else counts >= self.k
+        return np.where(enough, means, np.nan)
+
+    def transform(self, df, rows=None):
+        # fill the missing long runs of `rows` (a boolean mask, default every
+        # row), one batch per pool; the widest pool is taken race by race
+        # to keep its matrices small
+        rows = pd.Series(True, index=df.index) if rows is None else rows
+        for col in self.cols:
+            targets = df[rows & df[col].isna()]
+            if targets.empty:
+                continue
+            perf, values, orders, pools = self.index[col]
+            queries = targets[self.perf_col].to_numpy(dtype=float)
+            query_orders = race_order(targets["race_id"])
+            fills = np.full(len(targets), np.nan)
+            for level, keys in enumerate(self.pool_keys(col)):
+                pending = np.flatnonzero(np.isnan(fills))
+                if not len(pending):
+                    break
+                last = level == len(pools) - 1
+                batches = targets.iloc[pending].groupby(keys or ["race_id"], observed=True, sort=False).indices
+                for key, positions in batches.items():
+                    candidates = pools[level].get(key if keys else ())
+                    if candidates is None:
+                        continue
+                    at = pending[positions]
+                    fills[at] = self.nearest_mean(perf[candidates], values[candidates], orders[candidates],
+                                                  queries[at], query_orders[at], last)
+            df.loc[targets.index, col] = fills
+        return df
+
+
+# per-race position overrides, applied before the general repair:
+# {race_id: {column: source column}} copies the source column into the
+# column for that race (e.g. no qualifying session was classified)
+position_rules = {
+    "24-17": {"qualifying": "finishing_position"},
+    "23-19": {"qualifying": "finishing_position"},
+}
+
+def apply_position_rules(df, rules=position_rules):
+    for race_id, overrides in rules.items():
+        mask = df["race_id"] == race_id
+        for col, source in overrides.items():
+            df.loc[mask, col] = df.loc[mask, source]
+    return df
+
+def fill_missing_slots(df, col, by="race_id"):
+    # give the missing rows of every race the positions 1..n nobody in that
+    # race holds, smallest position to the first missing row
+    if df.empty:
+        return df
+    sizes = df.groupby(by, observed=True, sort=False).size()
+    slots = pd.DataFrame({
+        by: np.repeat(sizes.index.to_numpy(), sizes.to_numpy()),
+        col: np.concatenate([np.arange(1, n + 1) for n in sizes.to_numpy()]).astype(float),
+    })
+    taken = df[[by, col]].dropna().drop_duplicates()
+    free = slots.merge(taken, on=[by, col], how="left", indicator=True)
+    free = free[free["_merge"] == "left_only"].drop(columns="_merge")
+    free["slot"] = free.groupby(by, observed=True).cumcount()
+
+    missing = df.loc[df[col].isna(), [by]]
+    missing["slot"] = missing.groupby(by, observed=True).cumcount()
+    filled = missing.reset_index().merge(free, on=[by, "slot"], how="inner").set_index("index")
+    df.loc[filled.index, col] = filled[col]
+    return df
+
+def renumber_positions(df, col, by="race_id"):
+    # close gaps so every race runs 1..n in the existing order
+    df[col] = df.groupby(by, observed=True)[col].rank(method="first")
+    return df
+
+def discontinuous_races(df, col, by="race_id"):
+    stats = df.groupby(by, observed=True)[col].agg(["min", "max", "nunique", "size"])
+    bad = (stats["min"] != 1) | (stats["max"] != stats["size"]) | (stats["nunique"] != stats["size"])
+    return stats.index[bad].tolist()
+
+
+weather_cols = ["fp1_weather", "fp2_weather", "fp3_weather", "qualifying_weather", "race_weather"]
+
+# each weather gap is filled from the session next to it, in this order
+weather_fallbacks = [
+    ("fp1_weather", "fp2_weather"),
+    ("fp2_weather", "fp1_weather"),
+    ("fp3_weather", "qualifying_weather"),
+    ("qualifying_weather", "fp3_weather"),
+    ("race_weather", "qualifying_weather"),
+    ("fp3_weather", "race_weather"),
+    ("qualifying_weather", "race_weather"),
+]
+
+def fill_weather(df):
+    # mask rather than replace, so categorical columns keep their dtype
+    df[weather_cols] = df[weather_cols].mask(df[weather_cols] == "unknown")
+    for col, source in weather_fallbacks:
+        mask = df[col].isna()
+        df.loc[mask, col] = df.loc[mask, source]
+    return df
+
+def drop_empty_races(df, cols=fp_cols):
+    # races where no driver has any long run have nothing to impute from
+    all_missing = df[cols].isna().all(axis=1)
+    empty = all_missing.groupby(df["race_id"], observed=True).transform("all")
+    return df[~empty].copy()
+
+
+class RaceImputer:
+    # the missing-values pipeline as a fitted object. everything except the
+    # nearest-neighbour long-run fill only looks inside a race, so the fitted
+    # state is just the pool of known long runs; transform() on newly ingested
+    # races gives the values a full rebuild would give them. persisted with
+    # joblib next to scaler.pkl. races transform() had to drop (no long runs
+    # at all) are remembered, so incremental runs don't take them for new ones
+    dropped = ()
+
+    def __init__(self, k=5, rules=position_rules):
+        self.nearest = NearestNeighbourImputer(k)
+        self.rules = rules
+        self.candidates = None
+
+    @staticmethod
+    def prefill(df):
+        df = df.copy()
+        fill_from_own_sessions(df)
+        fill_from_teammates(df)
+        return df
+
+    def partial_fit(self, df):
+        # add the long runs of these races to the candidate pool (replacing
+        # any races already in it)
+        cols = ["race_id", "track_type", "team_perf"] + fp_cols + [c.replace("_long_run", "_weather") for c in fp_cols]
+        known = self.prefill(df)[cols]
+        known = known[known[fp_cols].notna().any(axis=1)]
+        if self.candidates is not None:
+            kept = self.candidates[~self.candidates["race_id"].isin(known["race_id"])]
+            known = pd.concat([kept, known], ignore_index=True)
+        self.candidates = known.reset_index(drop=True)
+        self.nearest.fit(self.candidates)
+        return self
+
+    def fit(self, df):
+        self.candidates = None
+        return self.partial_fit(df)
+
+    def transform(self, df):
+        if df.empty:
+            return df.copy()
+        df = self.prefill(df)
+        # dropped before the nearest-neighbour fill, whose widest pool would
+        # otherwise fill a whole grid from other tracks
+        races = set(df["race_id"])
+        df = drop_empty_races(df)
+        self.dropped = sorted(set(self.dropped) | (races - set(df["race_id"])))
+        if df.empty:
+            return df
+        self.nearest.transform(df, rows=df[fp_cols].isna().all(axis=1))
+        fill_weather(df)
+
+        fill_missing_slots(df, "finishing_position")
+        apply_position_rules(df, self.rules)
+        fill_missing_slots(df, "qualifying")
+
+        df = df[df["race_pace"].notna()].copy()
+        renumber_positions(df, "finishing_position")
+        return df
@@ -0,0 +1,124 @@
+import argparse
+import contextlib
+import cProfile
+import json
+import os
+import sys
+import time
+import tracemalloc
+import pandas as pd
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# structured timings as json lines, one object per event. off unless
+# F1_TRACE names a file to append to ("-" for stderr). every record has the
+# event, a timestamp and the pid; span() adds the wall time of a block and
+# stage() also rows in/out and memory. F1_PROFILE_DIR also dumps a cProfile
+# of every stage there. the process max rss is always recorded; a tracemalloc
+# peak per stage (F1_TRACE_MEMORY=1) is exact for python and numpy buffers
+# but slows the stage down, so it's opt-in. settings go through the
+# environment so worker processes trace into the same file
+
+trace_path = os.environ.get("F1_TRACE")
+profile_dir = os.environ.get("F1_PROFILE_DIR")
+trace_memory = os.environ.get("F1_TRACE_MEMORY") == "1"
+
+
+def configure(trace=None, profile=None, memory=None):
+    global trace_path, profile_dir, trace_memory
+    if trace is not None:
+        trace_path = os.environ["F1_TRACE"] = trace
+    if profile is not None:
+        profile_dir = os.environ["F1_PROFILE_DIR"] = profile
+    if memory is not None:
+        trace_memory = memory
+        os.environ["F1_TRACE_MEMORY"] = "1" if memory else "0"
+
+
+def emit(event, **fields):
+    if not trace_path:
+        return
+    record = {"ts": round(time.time(), 3), "pid": os.getpid(), "event": event, **fields}
+    line = json.dumps(record, default=str) + "\n"
+    if trace_path == "-":
+        sys.stderr.write(line)
+        return
+    # one short append per record, so threads and processes don't interleave
+    with open(trace_path, "a", encoding="utf-8") as f:
+        f.write(line)
+
+
+def max_rss_mb():
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on linux, bytes on macos
+    return round(rss / (2**20 if sys.platform == "darwin" else 2**10), 1)
+
+
+@contextlib.contextmanager
+def span(event, **fields):
+    # times the block and emits one record; the block can add fields to the
+    # yielded dict. a failing block is recorded with its error and re-raised
+    record = dict(fields)
+    start = time.perf_counter()
+    try:
+        yield record
+    except Exception as e:
+        record["error"] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        record["seconds"] = round(time.perf_counter() - start, 6)
+        emit(event, **record)
+
+
+@contextlib.contextmanager
+def stage(name, rows_in=None, **fields):
+    # a pipeline stage: span() plus rows, memory and the optional profile.
+    # the block sets record["rows_out"]
+    own_tracing = bool(trace_path) and trace_memory and not tracemalloc.is_tracing()
+    if own_tracing:
+        tracemalloc.start()
+    profiler = cProfile.Profile() if profile_dir else None
+    try:
+        with span("stage", stage=name, rows_in=rows_in, **fields) as record:
+            if profiler:
+                profiler.enable()
+            try:
+                yield record
+            finally:
+                if profiler:
+                    profiler.disable()
+                if own_tracing:
+                    record["peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 2**20, 1)
+                record["max_rss_mb"] = max_rss_mb()
+    finally:
+        if own_tracing:
+            tracemalloc.stop()
+        if profiler:
+            os.makedirs(profile_dir, exist_ok=True)
+            profiler.dump_stats(os.path.join(profile_dir, f"{name}-{os.getpid()}-{int(time.time())}.prof"))
+
+
+def read_trace(path):
+    with open(path, encoding="utf-8") as f:
+        return pd.DataFrame([json.loads(line) for line in f if line.strip()])
+
+
+def summary(trace):
+    # total/mean/max seconds per event (and stage or model where there is one)
+    keys = [c for c in ["event", "stage", "model", "session"] if c in trace]
+    timed = trace[trace["seconds"].notna()] if "seconds" in trace else trace.iloc[:0]
+    grouped = timed.fillna({k: "" for k in keys}).groupby(keys, sort=False)["seconds"]
+    return grouped.agg(["count", "sum", "mean", "max"]).sort_values("sum", ascending=False)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("trace", help="json lines file written with F1_TRACE")
+    args = parser.parse_args()
+
+    print(summary(read_trace(args.trace)).to_string(float_format=lambda x: f"{x:.3f}"))
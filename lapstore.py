@@ -0,0 +1,218 @@
+import argparse
+import glob
+import json
+import os
+import shutil
+import time
+import numpy as np
+import pandas as pd
+import schema
+from features import long_run_avgs, race_paces, stint_features, lookup, long_run_window
+from sessions import entrants, load_summary, session_types
+
+# lap-level archive, written during ingestion, so per-driver features can be
+# recomputed without going back to FastF1. every session is a folder
+# {archive_dir}/{year}/{round}/{session}/ with one .npy per column and a
+# meta.json (driver codes, compounds, event, the race's entrants):
+#   lap_ms, pit_in_ms, pit_out_ms   int32 milliseconds, -1 when missing
+#   driver                          int16 index into meta["drivers"]
+#   lap_number                      int16, -1 when missing
+#   stint, compound                 int8, compound indexes meta["compounds"]
+# the arrays are opened memory-mapped, so reading a session only costs the
+# pages that are touched
+
+archive_dir = os.environ.get("F1_LAP_ARCHIVE", "laps")
+array_names = ["lap_ms", "pit_in_ms", "pit_out_ms", "driver", "lap_number", "stint", "compound"]
+missing = -1
+
+# qualifying is loaded without laps
+lap_sessions = [stype for stype in session_types if stype != 'Q']
+
+# the dataset columns recompute() rebuilds
+lap_columns = ["fp1_long_run", "fp2_long_run", "fp3_long_run", "race_pace"] + schema.stint_columns
+
+
+def session_dir(year, rnd, stype):
+    return os.path.join(archive_dir, str(year), f"{rnd:02d}", stype)
+
+def to_ms(values):
+    ms = (pd.to_timedelta(pd.Series(values)) / pd.Timedelta(milliseconds=1)).round()
+    return ms.fillna(missing).to_numpy(np.int32)
+
+def from_ms(values):
+    values = np.asarray(values)
+    return pd.to_timedelta(np.where(values == missing, np.nan, values), unit='ms')
+
+def from_int(values):
+    values = np.asarray(values)
+    return np.where(values == missing, np.nan, values)
+
+def index_of(values, categories):
+    # position of every value in categories, -1 when missing
+    return pd.Categorical(values, categories=categories).codes
+
+def write_session(year, rnd, stype, summary, overwrite=True):
+    # archives one loaded session (a sessions.SessionSummary); sessions
+    # without laps are skipped. returns the folder, or None
+    try:
+        laps = summary.laps
+    except Exception:
+        return None
+    path = session_dir(year, rnd, stype)
+    if not overwrite and os.path.exists(path):
+        return path
+
+    laps = laps[laps['Driver'].notna()]
+    def col(name):
+        return laps[name] if name in laps else pd.Series(np.nan, index=laps.index)
+
+    drivers = sorted(laps['Driver'].astype(str).unique())
+    compounds = sorted(col('Compound').dropna().astype(str).unique())
+    arrays = {
+        "lap_ms": to_ms(laps['LapTime']),
+        "pit_in_ms": to_ms(col('PitInTime')),
+        "pit_out_ms": to_ms(col('PitOutTime')),
+        "driver": index_of(laps['Driver'].astype(str), drivers).astype(np.int16),
+        "lap_number": col('LapNumber').fillna(missing).to_numpy(np.int16),
+        "stint": col('Stint').fillna(missing).to_numpy(np.int8),
+        "compound": index_of(col('Compound'), compounds).astype(np.int8),
+    }
+    meta = {
+        "laps": len(laps),
+        "drivers": drivers,
+        "compounds": compounds,
+        "event": summary.event.get('EventName', "unknown"),
+        "format": summary.event.get('EventFormat', ""),
+        "entrants": entrants(summary)[0],
+    }
+
+    # written next to the target and swapped in, so readers never see half a session
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+    for name, values in arrays.items():
+        np.save(os.path.join(tmp_path, f"{name}.npy"), values)
+    with open(os.path.join(tmp_path, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    os.replace(tmp_path, path)
+    return path
+
+def write_weekend(year, rnd, loaded, overwrite=True):
+    # loaded is {session type: summary or None}, as sessions.load_weekend returns it
+    paths = []
+    for stype, summary in loaded.items():
+        path = write_session(year, rnd, stype, summary, overwrite) if summary is not None else None
+        if path:
+            paths.append(path)
+    return paths
+
+def read_meta(year, rnd, stype):
+    path = os.path.join(session_dir(year, rnd, stype), "meta.json")
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+def read_arrays(year, rnd, stype, mmap=True):
+    path = session_dir(year, rnd, stype)
+    return {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r" if mmap else None)
+            for name in array_names}
+
+def read_laps(year, rnd, stype):
+    # the session's laps with the columns sessions.lap_cols keeps, so the
+    # features functions take them as they are; None when not archived
+    meta = read_meta(year, rnd, stype)
+    if meta is None:
+        return None
+    arrays = read_arrays(year, rnd, stype)
+    # index -1 picks the trailing None
+    compounds = np.array(meta["compounds"] + [None], dtype=object)
+    return pd.DataFrame({
+        'Driver': np.array(meta["drivers"], dtype=object)[arrays["driver"]],
+        'LapTime': from_ms(arrays["lap_ms"]),
+        'LapNumber': from_int(arrays["lap_number"]),
+        'Stint': from_int(arrays["stint"]),
+        'Compound': compounds[arrays["compound"]],
+        'PitInTime': from_ms(arrays["pit_in_ms"]),
+        'PitOutTime': from_ms(arrays["pit_out_ms"]),
+    })
+
+def archived_rounds(years=None):
+    # [(year, round), ...] with an archived race
+    rounds = []
+    for path in sorted(glob.glob(os.path.join(archive_dir, "*", "*", "R", "meta.json"))):
+        year, rnd = path.split(os.sep)[-4:-2]
+        if years is None or int(year) in years:
+            rounds.append((int(year), int(rnd)))
+    return rounds
+
+def recompute(year, rnd, window=long_run_window):
+    # the lap-derived columns of one round, one row per race entrant in the
+    # datasets' row order; None when the race isn't archived. sprint weekends
+    # take their fp3 columns from the sprint, as getData does
+    meta = read_meta(year, rnd, 'R')
+    if meta is None:
+        return None
+    drv_codes = meta["entrants"]
+    laps = {stype: read_laps(year, rnd, stype) for stype in lap_sessions}
+    if meta["format"] == 'sprint':
+        practice = [laps['FP1'], None, laps['S']]
+    else:
+        practice = [laps['FP1'], laps['FP2'], laps['FP3']]
+
+    df = pd.DataFrame({"race_id": f"{year%100}-{rnd:02d}", "driver": drv_codes})
+    for i, session_laps in enumerate(practice, 1):
+        df[f"fp{i}_long_run"] = lookup(long_run_avgs(session_laps, window), drv_codes)
+    df["race_pace"] = lookup(race_paces(laps['R']), drv_codes)
+    for i, session_laps in enumerate(practice, 1):
+        df[f"fp{i}_deg"] = lookup(stint_features(session_laps)["deg"], drv_codes)
+    race_stints = stint_features(laps['R'])
+    for col in ["deg", "stint_length", "stops", "pit_loss"]:
+        df[f"race_{col}"] = lookup(race_stints[col], drv_codes)
+    return df[["race_id", "driver"] + lap_columns]
+
+def recompute_rounds(rounds, window=long_run_window):
+    frames = [recompute(year, rnd, window) for year, rnd in rounds]
+    frames = [df for df in frames if df is not None]
+    if not frames:
+        return pd.DataFrame(columns=["race_id", "driver"] + lap_columns)
+    return pd.concat(frames, ignore_index=True)
+
+def archive(years, rounds, overwrite=False):
+    # backfill from the summary cache (loading sessions that aren't cached)
+    written = 0
+    for year in years:
+        for rnd in rounds:
+            loaded = {stype: load_summary(year, rnd, stype) for stype in lap_sessions}
+            written += len(write_weekend(year, rnd, loaded, overwrite))
+    return written
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("mode", choices=["archive", "features"],
+                        help="archive: backfill the archive from cached sessions; "
+                             "features: recompute the lap-derived columns from it")
+    parser.add_argument("--years", type=int, nargs="+")
+    parser.add_argument("--rounds", type=int, default=24, help="rounds per season to archive")
+    parser.add_argument("--overwrite", action="store_true", help="rewrite sessions already archived")
+    parser.add_argument("--long-run-window", type=float, nargs=2, default=list(long_run_window))
+    parser.add_argument("--out", help="csv to write the recomputed features to")
+    args = parser.parse_args()
+
+    if args.mode == "archive":
+        if not args.years:
+            parser.error("archive needs --years")
+        written = archive(args.years, range(1, args.rounds + 1), args.overwrite)
+        print(f"{written} sessions archived under {archive_dir}")
+    else:
+        start = time.perf_counter()
+        rounds = archived_rounds(args.years)
+        df = recompute_rounds(rounds, tuple(args.long_run_window))
+        print(f"{len(rounds)} rounds, {len(df)} rows recomputed in {time.perf_counter() - start:.2f} s")
+        if args.out:
+            df.to_csv(args.out, index=False)
+        else:
+            print(df.to_string(max_rows=20))
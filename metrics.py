@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+
+# per-race ranking metrics for any number of models at once. both the actual
+# results and the predictions follow "smaller = better" (finishing position,
+# relative finish, ranker score), and every metric is computed with grouped
+# operations over the race codes rather than a loop over races
+
+metric_cols = ["ndcg", "spearman", "correct", "top3", "top10"]
+
+
+def evaluate(race_ids, actual, predictions, k=10):
+    # race_ids, actual: one value per driver row; predictions: {model: array}
+    # returns one row per (race_id, model) with metric_cols
+    codes, races = pd.factorize(pd.Series(race_ids).astype(str), sort=False)
+    models = list(predictions)
+    pred = pd.DataFrame({m: np.asarray(predictions[m], dtype=float) for m in models})
+    actual = pd.Series(np.asarray(actual, dtype=float))
+
+    # tied predictions share their average position: the rows of a race are
+    # mostly stored in finishing order, so breaking ties by row order would
+    # hand a constant prediction the true result
+    true_pos = actual.groupby(codes).rank(method="first").to_numpy()[:, None]
+    pred_pos = pred.groupby(codes).rank().to_numpy()
+    size = np.bincount(codes)[codes][:, None]
+
+    def per_race(values):
+        return pd.DataFrame(values).groupby(codes).sum().to_numpy()
+
+    # spearman: pearson correlation of average ranks within each race
+    true_rank = actual.groupby(codes).rank().to_numpy()[:, None]
+    pred_rank = pred_pos
+    true_dev = true_rank - (size + 1) / 2
+    pred_dev = pred_rank - pd.DataFrame(pred_rank).groupby(codes).transform("mean").to_numpy()
+    with np.errstate(invalid="ignore", divide="ignore"):
+        spearman = per_race(true_dev * pred_dev) / np.sqrt(per_race(true_dev ** 2) * per_race(pred_dev ** 2))
+
+    # ndcg@k with linear gain: the winner is worth size - 1, last place 0
+    gain = size - true_pos
+    discount = lambda pos: np.where(pos <= k, 1 / np.log2(pos + 1), 0.0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        ndcg = per_race(gain * discount(pred_pos)) / per_race(gain * discount(true_pos))
+
+    race_size = np.bincount(codes)[:, None]
+    metrics = {
+        "ndcg": ndcg,
+        "spearman": spearman,
+        "correct": per_race(pred_pos == true_pos).astype(int),
+        "top3": per_race((pred_pos <= 3) & (true_pos <= 3)) / np.minimum(3, race_size),
+        "top10": per_race((pred_pos <= 10) & (true_pos <= 10)) / np.minimum(10, race_size),
+    }
+
+    index = pd.MultiIndex.from_product([races, models], names=["race_id", "model"])
+    return pd.DataFrame({name: values.ravel() for name, values in metrics.items()},
+                        index=index).reset_index()
+
+
+def summary(report):
+    # mean of every metric per model, best spearman first
+    return (report.groupby("model", sort=False)[metric_cols].mean()
+            .sort_values("spearman", ascending=False))
@@ -0,0 +1,200 @@
+import argparse
+import glob
+import hashlib
+import inspect
+import json
+import os
+import joblib
+import artifacts
+import instrument
+import preprocessing
+import ranker
+import regression
+import scaling
+import schema
+import storage
+import tracks
+from imputation import RaceImputer
+
+# runs merge -> impute -> encode -> scale -> train in one process, passing
+# frames in memory. every stage's output is cached under cache_dir, keyed by
+# a hash of its upstream keys, the source files it runs, its wrapper below
+# and the config values it reads, so only stages whose inputs changed are rerun
+cache_dir = os.environ.get("F1_PIPELINE_CACHE", "cache/pipeline")
+code_dir = os.path.dirname(os.path.abspath(__file__))
+
+default_config = {
+    "k": 5,
+    "n_test": ranker.n_test,
+    "models": ["ranker", "regression"],
+}
+
+def merge(config):
+    return {"df": storage.read_dataset("all_drivers")}
+
+def impute(config, merged):
+    imputer = RaceImputer(k=config["k"]).fit(merged["df"])
+    return {"df": imputer.transform(merged["df"]), "imputer": imputer}
+
+def encode(config, imputed):
+    return {"df": preprocessing.encode(imputed["df"])}
+
+def scale(config, encoded):
+    df, scaler = scaling.scale(encoded["df"])
+    return {"df": df, "scaler": scaler}
+
+def train(config, encoded, scaled):
+    # each model script gets the same compact frame it would load itself
+    results = {}
+    if "ranker" in config["models"]:
+        df = schema.apply(encoded["df"], "encoded_not_scaled")
+        results["ranker"] = ranker.train(df, config["n_test"])
+    if "regression" in config["models"]:
+        df = schema.apply(scaled["df"], "encoded_scaled")
+        results["regression"] = regression.train(df, config["n_test"])
+    return results
+
+# name -> (function, upstream stages, source files, config keys)
+stages = {
+    "merge": (merge, [], ["storage.py", "schema.py"], []),
+    "impute": (impute, ["merge"], ["imputation.py"], ["k"]),
+    "encode": (encode, ["impute"], ["preprocessing.py", "schema.py", "tracks.py"], []),
+    "scale": (scale, ["encode"], ["scaling.py"], []),
+    "train": (train, ["encode", "scale"], ["ranker.py", "regression.py", "schema.py"], ["n_test", "models"]),
+}
+
+def file_digest(path):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def stage_files(name):
+    paths = [os.path.join(code_dir, f) for f in stages[name][2]]
+    # data the stage reads from disk rather than from an upstream stage
+    if name == "merge":
+        paths += storage.dataset_files("all_drivers")
+    if name == "encode":
+        paths.append(tracks.registry_path)
+    return paths
+
+def stage_keys(config):
+    keys = {}
+    for name, (fn, upstream, _, params) in stages.items():
+        h = hashlib.sha256(name.encode())
+        for dep in upstream:
+            h.update(keys[dep].encode())
+        h.update(inspect.getsource(fn).encode())
+        for path in stage_files(name):
+            h.update(os.path.basename(path).encode())
+            h.update(file_digest(path).encode())
+        h.update(json.dumps({p: config[p] for p in params}, sort_keys=True).encode())
+        keys[name] = h.hexdigest()[:16]
+    return keys
+
+def rows(output):
+    # rows of a stage's frame, or of the test rows for each trained model
+    if "df" in output:
+        return len(output["df"])
+    return {name: len(result[1]) for name, result in output.items()}
+
+def cache_path(name, key):
+    return os.path.join(cache_dir, f"{name}-{key}.pkl")
+
+def run(targets=("train",), config=None, force=()):
+    # returns {stage: output} for every stage that had to be loaded or run
+    # to produce the targets; a cached target never touches its upstream
+    config = {**default_config, **(config or {})}
+    keys = stage_keys(config)
+    outputs = {}
+
+    def get(name):
+        if name in outputs:
+            return outputs[name]
+        path = cache_path(name, keys[name])
+        if name not in force and os.path.exists(path):
+            print(f"{name}: cached {keys[name]}")
+            with instrument.span("stage_cached", stage=name, key=keys[name]):
+                outputs[name] = joblib.load(path)
+            return outputs[name]
+
+        func, upstream, _, _ = stages[name]
+        inputs = [get(dep) for dep in upstream]
+        print(f"{name}: running {keys[name]}")
+        with instrument.stage(name, rows_in=rows(inputs[0]) if inputs else None, key=keys[name]) as record:
+            outputs[name] = func(config, *inputs)
+            record["rows_out"] = rows(outputs[name])
+        os.makedirs(cache_dir, exist_ok=True)
+        joblib.dump(outputs[name], f"{path}.tmp")
+        os.replace(f"{path}.tmp", path)
+        return outputs[name]
+
+    for target in targets:
+        get(target)
+    return outputs
+
+def write_outputs(outputs):
+    # the same datasets and artifacts the standalone scripts produce
+    if "impute" in outputs:
+        storage.write_dataset(outputs["impute"]["df"], "preprocessed")
+        joblib.dump(outputs["impute"]["imputer"], "imputer.pkl")
+    if "encode" in outputs:
+        storage.write_dataset(outputs["encode"]["df"], "encoded_not_scaled")
+    if "scale" in outputs:
+        df = outputs["scale"]["df"]
+        storage.write_dataset(df, "encoded_scaled")
+        races = df["race_id"].unique()
+        scaling.save_version(outputs["scale"]["scaler"], races, races, "full")
+    results = outputs.get("train", {})
+    if "ranker" in results:
+        for name, model in results["ranker"][0].items():
+            artifacts.save_model(f"ranker_{name}", model, ranker.feature_cols, scaled=False)
+    if "regression" in results:
+        for name, model in results["regression"][0].items():
+            artifacts.save_model(regression.model_name(name), model, regression.feature_cols, scaled=True)
+
+def clear_cache(keep):
+    # drop cached outputs that no longer match the current keys
+    for path in glob.glob(os.path.join(cache_dir, "*.pkl")):
+        name, key = os.path.basename(path)[:-4].rsplit("-", 1)
+        if keep.get(name) != key:
+            os.remove(path)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--stages", nargs="+", choices=list(stages), default=["train"],
+                        help="stages to produce; their upstream stages run or load as needed")
+    parser.add_argument("--force", nargs="+", choices=list(stages), default=[],
+                        help="rerun these stages even if their cached output is current")
+    parser.add_argument("--k", type=int, default=default_config["k"],
+                        help="neighbours for the long-run imputer")
+    parser.add_argument("--n-test", type=int, default=default_config["n_test"],
+                        help="number of most recent races held out by the models")
+    parser.add_argument("--models", nargs="+", choices=default_config["models"],
+                        default=default_config["models"])
+    parser.add_argument("--write", action="store_true",
+                        help="also write the intermediate datasets, imputer.pkl, a new scaler version and the models")
+    parser.add_argument("--prune", action="store_true",
+                        help="delete cached stage outputs from older inputs or configs")
+    parser.add_argument("--trace", help="append json-lines timings per stage and model to this file")
+    parser.add_argument("--profile", help="also dump a cProfile of every stage that runs into this directory")
+    parser.add_argument("--trace-memory", action="store_true",
+                        help="add a tracemalloc peak to every stage (slows the stages down)")
+    args = parser.parse_args()
+
+    instrument.configure(args.trace, args.profile, args.trace_memory or None)
+
+    config = {"k": args.k, "n_test": args.n_test, "models": args.models}
+    outputs = run(args.stages, config, force=args.force)
+    if args.write:
+        write_outputs(outputs)
+    if args.prune:
+        clear_cache(stage_keys({**default_config, **config}))
+
+    results = outputs.get("train", {})
+    if "ranker" in results:
+        ranker.report(results["ranker"][1])
+    if "regression" in results:
+        regression.report(*results["regression"][1:])
@@ -0,0 +1,168 @@
+import argparse
+import http.server
+import json
+import sys
+import time
+import numpy as np
+import artifacts
+import scaling
+import tracks
+
+# inference for one race or a batch of races. a race is
+#   {"race_id": "26-01", "track": "Australian Grand Prix",
+#    "race_weather": "dry", ...,
+#    "drivers": [{"driver": "VER", "qualifying": 1, "driver_perf": 0.9,
+#                 "team_perf": 0.8, "fp1_long_run": 81.2, ..., "fp1_weather": "dry"}, ...]}
+# weather keys can be given per race or per driver. models, the scaler and
+# the track registry are loaded once, and each race is built straight into
+# a float32 matrix, so a prediction is a few array operations plus the model
+
+weather_codes = {"dry": 0, "rainy": 1}
+weather_cols = ["fp1_weather", "fp2_weather", "fp3_weather", "qualifying_weather", "race_weather"]
+driver_cols = ["driver_perf", "team_perf", "fp1_long_run", "fp2_long_run", "fp3_long_run"]
+default_model = "ranker_lightgbm"
+
+
+class Predictor:
+    def __init__(self, names=None):
+        index = artifacts.load_index()
+        if not index:
+            raise ValueError(f"no models in {artifacts.index_path}, run ranker.py or regression.py first")
+        self.models = {name: artifacts.load_model(name) for name in (names or index)}
+        self.default = default_model if default_model in self.models else next(iter(self.models))
+
+        # mean/scale of the scaled feature columns, from the latest scaler
+        scaler = scaling.load_scaler()
+        self.scale = {col: (scaler.mean_[i], scaler.scale_[i]) for i, col in enumerate(scaling.scale_cols)}
+        tracks.load_registry()
+
+    def features(self, race, columns, scaled):
+        rows = race["drivers"]
+        environment, setup, length = tracks.lookup(race["track"])
+        qualifying = np.array([row.get("qualifying", np.nan) for row in rows], dtype=float)
+        values = {
+            "track_environment": environment,
+            "setup_demand": setup,
+            "track_length": length,
+            # grid size as preprocessing counts it: drivers with a qualifying position
+            "relative_qualifying": qualifying / np.count_nonzero(~np.isnan(qualifying)),
+        }
+        for col in weather_cols:
+            values[col] = [weather_codes.get(row.get(col, race.get(col)), np.nan) for row in rows]
+        for col in driver_cols:
+            values[col] = [row.get(col, np.nan) for row in rows]
+
+        # scaled in float64 like scaling.py, then cast like the training frames
+        X = np.empty((len(rows), len(columns)))
+        for j, col in enumerate(columns):
+            X[:, j] = values[col]
+            if scaled and col in self.scale:
+                mean, scale = self.scale[col]
+                X[:, j] = (X[:, j] - mean) / scale
+        return X.astype(np.float32)
+
+    def predict_race(self, race, model=None):
+        # returns the drivers ordered by predicted finish (smaller score = better)
+        name = model or self.default
+        if name not in self.models:
+            raise ValueError(f"unknown model {name}, available: {sorted(self.models)}")
+        predict, entry = self.models[name]
+        scores = np.asarray(predict(self.features(race, entry["features"], entry["scaled"])), dtype=float)
+        order = np.argsort(scores, kind="stable")
+        drivers = [row.get("driver", i) for i, row in enumerate(race["drivers"])]
+        return {
+            "race_id": race.get("race_id"),
+            "model": name,
+            "order": [drivers[i] for i in order],
+            "scores": [scores[i] for i in order],
+        }
+
+    def predict(self, payload, model=None):
+        # a single race, or {"races": [...]} for a batch
+        if not isinstance(payload, dict):
+            raise ValueError("payload must be a race object or {\"races\": [...]}")
+        model = payload.get("model", model)
+        if "races" in payload:
+            races = payload["races"]
+            if not isinstance(races, list):
+                raise ValueError("races must be a list")
+            for i, race in enumerate(races):
+                check_race(race, f"races[{i}]")
+            return {"races": [self.predict_race(race, model) for race in races]}
+        check_race(payload, "race")
+        return self.predict_race(payload, model)
+
+
+def check_race(race, where):
+    # the shape predict_race relies on; the values themselves may be missing
+    if not isinstance(race, dict):
+        raise ValueError(f"{where} must be an object")
+    if "track" not in race:
+        raise ValueError(f"{where} has no track")
+    drivers = race.get("drivers")
+    if not isinstance(drivers, list) or not drivers:
+        raise ValueError(f"{where}.drivers must be a non-empty list")
+    for i, row in enumerate(drivers):
+        if not isinstance(row, dict):
+            raise ValueError(f"{where}.drivers[{i}] must be an object")
+
+
+def serve(predictor, port=8000):
+    # POST /predict with a race or a batch of races; GET /models lists them
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def reply(self, status, body):
+            data = json.dumps(body).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path != "/models":
+                self.send_error(404)
+                return
+            self.reply(200, {"models": sorted(predictor.models), "default": predictor.default})
+
+        def do_POST(self):
+            if self.path != "/predict":
+                self.send_error(404)
+                return
+            try:
+                payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                self.reply(200, predictor.predict(payload))
+            except (ValueError, KeyError, TypeError) as e:
+                self.reply(400, {"error": str(e)})
+            except Exception as e:
+                # the client always gets an answer
+                self.reply(500, {"error": f"{type(e).__name__}: {e}"})
+
+        def log_message(self, format, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    print(f"Serving {sorted(predictor.models)} on http://127.0.0.1:{port}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("races", nargs="?", help="json file with a race or {\"races\": [...]}, - for stdin")
+    parser.add_argument("--model", help=f"model name from {artifacts.index_path}, default {default_model}")
+    parser.add_argument("--serve", action="store_true", help="run the http service instead")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+
+    predictor = Predictor()
+    if args.serve:
+        serve(predictor, args.port)
+    elif args.races is None:
+        parser.error("give a races file or --serve")
+    else:
+        with (sys.stdin if args.races == "-" else open(args.races, encoding="utf-8")) as f:
+            payload = json.load(f)
+        start = time.perf_counter()
+        result = predictor.predict(payload, args.model)
+        elapsed = time.perf_counter() - start
+        print(json.dumps(result, indent=1))
+        print(f"predicted in {elapsed * 1000:.2f} ms", file=sys.stderr)
@@ -1,102 +1,123 @@
-import pandas as pd
 import lightgbm as lgb
 import xgboost as xgb
-from sklearn.metrics import ndcg_score
-from scipy.stats import spearmanr
+import artifacts
+import instrument
+import metrics
+import schema
+import storage
+
+
+columns = [c for c in schema.encoded_columns if c != "race_pace"]
+feature_cols = [c for c in columns if c not in ("race_id", "relative_finish")]
+n_test = 19
+
+lgb_params = {
+    "objective": "lambdarank",
+    "metric": "ndcg",
+    "boosting_type": "gbdt",
+    "n_estimators": 200,
+    "learning_rate": 0.05,
+    "num_leaves": 31,
+    "verbose": 1
+}
 
+xgb_params = {
+    "objective": "rank:pairwise",
+    "eval_metric": "ndcg",
+    "eta": 0.05,
+    "max_depth": 6
+}
+num_boost_round = 200
 
-df = pd.read_csv("datasets/f1_encoded_not_scaled.csv")
 
-df = df.drop(columns=["race_pace"])
-df["rank_label"] = df.groupby("race_id")["relative_finish"].rank(method="first").astype(int)
+def load():
+    return storage.read_dataset("encoded_not_scaled", columns=columns, compact=True)
 
-X = df.drop(columns=["race_id", "relative_finish", "rank_label"])
-y = df["rank_label"]
 
+def train(df, n_test=n_test):
+    # trains both rankers on all but the last n_test races and returns them
+    # with the test rows and their predictions
+    df = df[columns].copy()
+    df["rank_label"] = df.groupby("race_id", observed=True)["relative_finish"].rank(method="first").astype(int)
 
-race_ids = df["race_id"].unique()
-train_races = race_ids[:-19]
-test_races = race_ids[-19:]
+    X = df.drop(columns=["race_id", "relative_finish", "rank_label"]).astype("float32")
+    y = df["rank_label"]
 
-X_train = X[df["race_id"].isin(train_races)]
-y_train = y[df["race_id"].isin(train_races)]
-groups_train = df[df["race_id"].isin(train_races)].groupby("race_id").size().to_list()
 
-X_test = X[df["race_id"].isin(test_races)]
-y_test = y[df["race_id"].isin(test_races)]
-groups_test = df[df["race_id"].isin(test_races)].groupby("race_id").size().to_list()
+    race_ids = df["race_id"].unique()
+    train_races = race_ids[:-n_test]
+    test_races = race_ids[-n_test:]
 
+    X_train = X[df["race_id"].isin(train_races)]
+    y_train = y[df["race_id"].isin(train_races)]
+    groups_train = df[df["race_id"].isin(train_races)].groupby("race_id", observed=True).size().to_list()
 
-print("training LightGBM Ranker")
-lgb_ranker = lgb.LGBMRanker(
-    objective="lambdarank",
-    metric="ndcg",
-    boosting_type="gbdt",
-    n_estimators=200,
-    learning_rate=0.05,
-    num_leaves=31,
-    verbose=1
-)
+    X_test = X[df["race_id"].isin(test_races)]
+    y_test = y[df["race_id"].isin(test_races)]
+    groups_test = df[df["race_id"].isin(test_races)].groupby("race_id", observed=True).size().to_list()
 
-lgb_ranker.fit(
-    X_train, y_train,
-    group=groups_train,
-    eval_set=[(X_test, y_test)],
-    eval_group=[groups_test],
-    eval_at=[5, 10]
-)
 
-y_pred_lgb = lgb_ranker.predict(X_test)
+    print("training LightGBM Ranker")
+    lgb_ranker = lgb.LGBMRanker(**lgb_params)
 
-ndcg_lgb = ndcg_score([y_test.values], [y_pred_lgb])
-corr_lgb, _ = spearmanr(y_test, y_pred_lgb)
-print(f"LightGBM NDCG: {ndcg_lgb:.4f}, Spearman: {corr_lgb:.4f}")
+    with instrument.span("fit", model="LightGBM Ranker", rows=len(X_train)):
+        lgb_ranker.fit(
+            X_train, y_train,
+            group=groups_train,
+            eval_set=[(X_test, y_test)],
+            eval_group=[groups_test],
+            eval_at=[5, 10]
+        )
 
-print("training XGBoost Ranker")
-dtrain = xgb.DMatrix(X_train, label=y_train)
-dtest = xgb.DMatrix(X_test, label=y_test)
+    with instrument.span("predict", model="LightGBM Ranker", rows=len(X_test)):
+        y_pred_lgb = lgb_ranker.predict(X_test)
 
+    print("training XGBoost Ranker")
+    dtrain = xgb.DMatrix(X_train, label=y_train)
+    dtest = xgb.DMatrix(X_test, label=y_test)
 
-dtrain.set_group(groups_train)
-dtest.set_group(groups_test)
 
-params = {
-    "objective": "rank:pairwise",
-    "eval_metric": "ndcg",
-    "eta": 0.05,
-    "max_depth": 6
-}
+    dtrain.set_group(groups_train)
+    dtest.set_group(groups_test)
 
-xgb_ranker = xgb.train(
-    params,
-    dtrain,
-    num_boost_round=200,
-    evals=[(dtest, "test")]
-)
+    with instrument.span("fit", model="XGBoost Ranker", rows=len(X_train)):
+        xgb_ranker = xgb.train(
+            xgb_params,
+            dtrain,
+            num_boost_round=num_boost_round,
+            evals=[(dtest, "test")]
+        )
 
-y_pred_xgb = xgb_ranker.predict(dtest)
+    with instrument.span("predict", model="XGBoost Ranker", rows=len(X_test)):
+        y_pred_xgb = xgb_ranker.predict(dtest)
 
-ndcg_xgb = ndcg_score([y_test.values], [y_pred_xgb])
-corr_xgb, _ = spearmanr(y_test, y_pred_xgb)
-print(ndcg_xgb, corr_xgb)
 
+    df_test = df[df["race_id"].isin(test_races)].copy()
+    df_test["pred_finish_lgb"] = y_pred_lgb
+    df_test["pred_finish_xgb"] = y_pred_xgb
 
-df_test = df[df["race_id"].isin(test_races)].copy()
-df_test["pred_finish_lgb"] = y_pred_lgb
-df_test["pred_finish_xgb"] = y_pred_xgb
+    return {"lightgbm": lgb_ranker, "xgboost": xgb_ranker}, df_test
 
-for race in test_races:
-    race_results = df_test[df_test["race_id"] == race].copy()
 
-    
-    true_order = race_results.sort_values("rank_label")["rank_label"].values
+def report(df_test):
+    # per-race metrics (ndcg@10, spearman, exact positions, top-3/top-10)
+    scores = metrics.evaluate(df_test["race_id"], df_test["rank_label"], {
+        "LightGBM": df_test["pred_finish_lgb"],
+        "XGBoost": df_test["pred_finish_xgb"],
+    })
+    correct = scores.pivot(index="race_id", columns="model", values="correct")
+    for race, row in correct.iterrows():
+        print(f"race {race}: LightGBM correct = {row['LightGBM']}, XGBoost correct = {row['XGBoost']}")
 
-    
-    lgb_order = race_results.sort_values("pred_finish_lgb")["rank_label"].values
-    lgb_accuracy = (true_order == lgb_order).sum()
+    print(metrics.summary(scores).to_string())
+    return scores
 
-    
-    xgb_order = race_results.sort_values("pred_finish_xgb")["rank_label"].values
-    xgb_accuracy = (true_order == xgb_order).sum()
 
-    print(f"race {race}: LightGBM correct = {lgb_accuracy}, XGBoost correct = {xgb_accuracy}")
\ No newline at end of file
+if __name__ == "__main__":
+    df = load()
+    with instrument.stage("ranker", rows_in=len(df)) as record:
+        models, df_test = train(df)
+        record["rows_out"] = len(df_test)
+    report(df_test)
+    for name, model in models.items():
+        artifacts.save_model(f"ranker_{name}", model, feature_cols, scaled=False)
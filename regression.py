@@ -1,81 +1,116 @@
-import pandas as pd
 from sklearn.linear_model import LinearRegression
 from sklearn.svm import SVR
 from sklearn.ensemble import GradientBoostingRegressor
 import lightgbm as lgb
 import xgboost as xgb
 from sklearn.metrics import mean_squared_error
-from scipy.stats import spearmanr
+import artifacts
+import instrument
+import metrics
+import schema
+import storage
 
-df = pd.read_csv("datasets/f1_encoded_scaled.csv")
+columns = [c for c in schema.encoded_columns if c != "race_pace"]
+feature_cols = [c for c in columns if c not in ("race_id", "relative_finish")]
+n_test = 19
 
-if "race_pace" in df.columns:
-    df = df.drop(columns=["race_pace"])
+xgb_params = {
+    "objective": "reg:squarederror",
+    "eta": 0.05,
+    "max_depth": 6,
+    "eval_metric": "rmse"
+}
+num_boost_round = 200
 
 
-X = df.drop(columns=["race_id", "relative_finish"])
-y = df["relative_finish"] 
+def model_name(name):
+    # "Gradient Boosting" -> "regression_gradient_boosting"
+    return "regression_" + name.lower().replace(" ", "_")
 
 
-race_ids = df["race_id"].unique()
-train_races = race_ids[:-19]
-test_races = race_ids[-19:]
+def make_models():
+    return {
+        "Linear Regression": LinearRegression(),
+        "SVR": SVR(kernel="rbf", C=1.0, epsilon=0.1),
+        "Gradient Boosting": GradientBoostingRegressor(n_estimators=200, learning_rate=0.05, max_depth=5),
+        "LightGBM": lgb.LGBMRegressor(objective="regression", n_estimators=200, learning_rate=0.05, num_leaves=31),
+    }
 
-X_train = X[df["race_id"].isin(train_races)].reset_index(drop=True)
-y_train = y[df["race_id"].isin(train_races)].reset_index(drop=True)
 
-X_test = X[df["race_id"].isin(test_races)].reset_index(drop=True)
-y_test = y[df["race_id"].isin(test_races)].reset_index(drop=True)
+def load():
+    return storage.read_dataset("encoded_scaled", columns=columns, compact=True)
 
-df_test = df[df["race_id"].isin(test_races)].reset_index(drop=True)
 
-models = {
-    "Linear Regression": LinearRegression(),
-    "SVR": SVR(kernel="rbf", C=1.0, epsilon=0.1),
-    "Gradient Boosting": GradientBoostingRegressor(n_estimators=200, learning_rate=0.05, max_depth=5),
-    "LightGBM": lgb.LGBMRegressor(objective="regression", n_estimators=200, learning_rate=0.05, num_leaves=31),
-}
+def train(df, n_test=n_test):
+    # fits every regressor on all but the last n_test races; returns the
+    # models, the test rows and each model's predictions for them
+    df = df[columns]
+    X = df.drop(columns=["race_id", "relative_finish"]).astype("float32")
+    y = df["relative_finish"] 
 
-predictions = {}
 
-for name, model in models.items():
-    print(f"\nTraining {name}...")
-    model.fit(X_train, y_train)
-    y_pred = model.predict(X_test)
-    predictions[name] = y_pred
+    race_ids = df["race_id"].unique()
+    train_races = race_ids[:-n_test]
+    test_races = race_ids[-n_test:]
 
-    mse = mean_squared_error(y_test, y_pred)
-    corr, _ = spearmanr(y_test, y_pred)
-    print(f"{name} MSE: {mse:.4f}, Spearman: {corr:.4f}")
+    X_train = X[df["race_id"].isin(train_races)].reset_index(drop=True)
+    y_train = y[df["race_id"].isin(train_races)].reset_index(drop=True)
 
-print("\nTraining XGBoost Regressor...")
-dtrain = xgb.DMatrix(X_train, label=y_train)
-dtest = xgb.DMatrix(X_test, label=y_test)
+    X_test = X[df["race_id"].isin(test_races)].reset_index(drop=True)
+    y_test = y[df["race_id"].isin(test_races)].reset_index(drop=True)
 
-params = {
-    "objective": "reg:squarederror",
-    "eta": 0.05,
-    "max_depth": 6,
-    "eval_metric": "rmse"
-}
+    df_test = df[df["race_id"].isin(test_races)].reset_index(drop=True)
+
+    models = make_models()
+
+    predictions = {}
+
+    for name, model in models.items():
+        print(f"\nTraining {name}...")
+        with instrument.span("fit", model=name, rows=len(X_train)):
+            model.fit(X_train, y_train)
+        with instrument.span("predict", model=name, rows=len(X_test)):
+            y_pred = model.predict(X_test)
+        predictions[name] = y_pred
+
+        mse = mean_squared_error(y_test, y_pred)
+        print(f"{name} MSE: {mse:.4f}")
+
+    print("\nTraining XGBoost Regressor...")
+    dtrain = xgb.DMatrix(X_train, label=y_train)
+    dtest = xgb.DMatrix(X_test, label=y_test)
+
+    with instrument.span("fit", model="XGBoost", rows=len(X_train)):
+        xgb_reg = xgb.train(xgb_params, dtrain, num_boost_round=num_boost_round, evals=[(dtest, "test")])
+    with instrument.span("predict", model="XGBoost", rows=len(X_test)):
+        y_pred_xgb = xgb_reg.predict(dtest)
+    predictions["XGBoost"] = y_pred_xgb
+
+    mse_xgb = mean_squared_error(y_test, y_pred_xgb)
+    print(f"XGBoost MSE: {mse_xgb:.4f}")
 
-xgb_reg = xgb.train(params, dtrain, num_boost_round=200, evals=[(dtest, "test")])
-y_pred_xgb = xgb_reg.predict(dtest)
-predictions["XGBoost"] = y_pred_xgb
+    models["XGBoost"] = xgb_reg
+    return models, df_test, predictions
 
-mse_xgb = mean_squared_error(y_test, y_pred_xgb)
-corr_xgb, _ = spearmanr(y_test, y_pred_xgb)
-print(f"XGBoost MSE: {mse_xgb:.4f}, Spearman: {corr_xgb:.4f}")
 
+def report(df_test, predictions):
+    # per-race metrics (ndcg@10, spearman, exact positions, top-3/top-10)
+    scores = metrics.evaluate(df_test["race_id"], df_test["relative_finish"], predictions)
+    for race, race_scores in scores.groupby("race_id", sort=False):
+        print(f"\nRace {race}:")
+        for name, accuracy in zip(race_scores["model"], race_scores["correct"]):
+            print(f"{name} correct = {accuracy}")
 
+    print()
+    print(metrics.summary(scores).to_string())
+    return scores
 
-for race in test_races:
-    race_results = df_test[df_test["race_id"] == race].copy()
-    true_order = race_results.sort_values("relative_finish")["relative_finish"].values
 
-    print(f"\nRace {race}:")
-    for name, y_pred in predictions.items():
-        race_results[f"pred_{name}"] = y_pred[race_results.index]
-        pred_order = race_results.sort_values(f"pred_{name}")["relative_finish"].values
-        accuracy = (true_order == pred_order).sum()
-        print(f"{name} correct = {accuracy}")
\ No newline at end of file
+if __name__ == "__main__":
+    df = load()
+    with instrument.stage("regression", rows_in=len(df)) as record:
+        models, df_test, predictions = train(df)
+        record["rows_out"] = len(df_test)
+    report(df_test, predictions)
+    for name, model in models.items():
+        artifacts.save_model(model_name(name), model, feature_cols, scaled=True)
@@ -0,0 +1,145 @@
+import argparse
+import http.server
+import os
+import shutil
+import time
+import numpy as np
+import pandas as pd
+from sessions import SessionSummary, summary_path, load_summary, session_types
+
+# recorded sessions live at {fixture_dir}/{year}/{round}_{session}.pkl, the
+# same layout as the summary cache, so a warm cache can be copied as-is.
+# point sessions.replay_dir (or F1_REPLAY_DIR) at that folder to replay them,
+# or at the url of serve() to replay them over http
+
+def record(fixture_dir, year, rounds):
+    # record live sessions (through the summary cache) as replay fixtures
+    for rnd in rounds:
+        for stype in session_types:
+            if load_summary(year, rnd, stype) is None:
+                continue
+            path = os.path.join(fixture_dir, f"{year}", f"{rnd:02d}_{stype}.pkl")
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            shutil.copyfile(summary_path(year, rnd, stype), path)
+
+def synthetic_stints(rng, grid_size, n_laps, stype):
+    # (stint, pit in, pit out) per driver and lap: practice in runs of 8 laps
+    # that start with an out-lap and end with an in-lap, one or two stops in
+    # the race, a single stint in the sprint
+    lap = np.tile(np.arange(1, n_laps + 1), (grid_size, 1))
+    if stype == 'S':
+        no_pit = np.zeros(lap.shape, dtype=bool)
+        return np.ones(lap.shape, dtype=int), no_pit, no_pit
+    if stype == 'R':
+        stops = np.column_stack([rng.integers(10, n_laps // 2, grid_size),
+                                 rng.integers(n_laps // 2, n_laps - 5, grid_size)])
+        stops[rng.random(grid_size) < 0.5, 1] = n_laps + 1
+        stint = 1 + (lap > stops[:, :1]).astype(int) + (lap > stops[:, 1:]).astype(int)
+        pit_in = (lap == stops[:, :1]) | (lap == stops[:, 1:])
+        return stint, pit_in, (lap == stops[:, :1] + 1) | (lap == stops[:, 1:] + 1)
+    stint = (lap - 1) // 8 + 1
+    return stint, (lap % 8 == 0) | (lap == n_laps), (lap - 1) % 8 == 0
+
+def synthesize(fixture_dir, year, rounds, grid_size=20, seed=0):
+    # plausible made-up sessions for boxes without FastF1 access: same
+    # columns and dtypes as the real summaries. sprint weekends follow the
+    # 2021-22 'sprint' format: FP1, qualifying, FP2, sprint, race
+    rng = np.random.default_rng([seed, year])
+    teams = [f"Team {i}" for i in range((grid_size + 1) // 2)]
+    codes = [f"D{i:02d}" for i in range(grid_size)]
+    drivers = [str(i + 1) for i in range(grid_size)]
+    driver_info = {drv: pd.Series({'Abbreviation': code, 'TeamName': teams[i // 2]})
+                   for i, (drv, code) in enumerate(zip(drivers, codes))}
+    points = {1: 25, 2: 18, 3: 15, 4: 12, 5: 10, 6: 8, 7: 6, 8: 4, 9: 2, 10: 1}
+    car_pace = rng.normal(0, 0.6, grid_size)
+    deg_rate = rng.uniform(0.03, 0.12, grid_size)
+    compounds = np.array(['SOFT', 'MEDIUM', 'HARD'])
+
+    for rnd in rounds:
+        sprint = rng.random() < 0.25
+        event = pd.Series({'EventName': f"Grand Prix {rnd}",
+                           'EventFormat': 'sprint' if sprint else 'conventional'})
+        base_lap = rng.uniform(70, 105)
+        stypes = ['R', 'FP1', 'Q', 'FP2'] + (['S'] if sprint else ['FP3'])
+        for stype in stypes:
+            n_laps = {'R': 60, 'S': 20}.get(stype, 25)
+            laps = None
+            if stype != 'Q':
+                stint, pit_in, pit_out = synthetic_stints(rng, grid_size, n_laps, stype)
+                lap_number = np.tile(np.arange(1, n_laps + 1), (grid_size, 1))
+                # laps since the stint's first lap
+                stint_start = np.where(np.diff(stint, prepend=0, axis=1) != 0, lap_number, 0)
+                age = lap_number - np.maximum.accumulate(stint_start, axis=1)
+                lap_secs = (base_lap + car_pace[:, None] + deg_rate[:, None] * age
+                            + rng.exponential(1.5, (grid_size, n_laps))
+                            + np.where(pit_in, 4.0, 0.0) + np.where(pit_out, 18.0, 0.0))
+                session_time = pd.to_timedelta(np.round(np.cumsum(lap_secs, axis=1).ravel(), 3), unit='s')
+                laps = pd.DataFrame({
+                    'Driver': np.repeat(codes, n_laps),
+                    'LapTime': pd.to_timedelta(np.round(lap_secs.ravel(), 3), unit='s'),
+                    'LapNumber': lap_number.ravel().astype(float),
+                    'Stint': stint.ravel().astype(float),
+                    'Compound': compounds[(stint.ravel() + rnd) % len(compounds)],
+                    'PitInTime': session_time.where(pit_in.ravel()),
+                    'PitOutTime': session_time.where(pit_out.ravel()),
+                })
+            order = np.argsort(car_pace + rng.normal(0, 0.5, grid_size))
+            position = np.empty(grid_size)
+            position[order] = np.arange(1, grid_size + 1)
+            results = pd.DataFrame({
+                'Abbreviation': codes,
+                'TeamName': [teams[i // 2] for i in range(grid_size)],
+                'Position': position,
+                'Points': [float(points.get(int(p), 0)) if stype == 'R' else 0.0 for p in position],
+            })
+            weather_data = pd.DataFrame({'Rainfall': rng.random(30) < (0.3 if rng.random() < 0.15 else 0)})
+            summary = SessionSummary(event, drivers, driver_info, laps, results, weather_data)
+
+            path = os.path.join(fixture_dir, f"{year}", f"{rnd:02d}_{stype}.pkl")
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            pd.to_pickle(summary, path)
+
+def serve(fixture_dir, port=8765, fail_rate=0.0, delay=0.0, seed=0):
+    # local stand-in for the live backend: serves the fixtures over http,
+    # answering a share of requests with 503 after an optional delay, to
+    # exercise retries and concurrency offline
+    rng = np.random.default_rng(seed)
+
+    class Handler(http.server.SimpleHTTPRequestHandler):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, directory=fixture_dir, **kwargs)
+
+        def do_GET(self):
+            time.sleep(delay)
+            if rng.random() < fail_rate:
+                self.send_error(503)
+                return
+            super().do_GET()
+
+        def log_message(self, format, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    print(f"Serving {fixture_dir} on http://127.0.0.1:{port}")
+    server.serve_forever()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("mode", choices=["record", "synthesize", "serve"])
+    parser.add_argument("--fixtures", default="fixtures/replay")
+    parser.add_argument("--years", type=int, nargs="+", default=[])
+    parser.add_argument("--rounds", type=int, default=24)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--fail-rate", type=float, default=0.0,
+                        help="share of requests answered with 503 when serving")
+    parser.add_argument("--delay", type=float, default=0.0,
+                        help="seconds every request takes when serving")
+    args = parser.parse_args()
+
+    if args.mode == "serve":
+        serve(args.fixtures, args.port, args.fail_rate, args.delay)
+    for year in args.years:
+        if args.mode == "record":
+            record(args.fixtures, year, range(1, args.rounds+1))
+        else:
+            synthesize(args.fixtures, year, range(1, args.rounds+1))
@@ -0,0 +1,102 @@
+from collections import deque
+import numpy as np
+import pandas as pd
+
+# points over the last `window` races, normalised by the most a driver
+# (25) or a team (43: win + second) could score in one race
+form_window = 5
+driver_norm = 25
+team_norm = 43
+
+
+class RollingWindow:
+    # fixed-size ring buffer with a running sum, O(1) per push
+
+    def __init__(self, size):
+        self.values = deque(maxlen=size)
+        self.total = 0.0
+
+    def push(self, value):
+        if len(self.values) == self.values.maxlen:
+            self.total -= self.values[0]
+        self.values.append(value)
+        self.total += value
+
+    def index(self, norm):
+        return self.total / (len(self.values) * norm) if self.values else 0.0
+
+
+class RollingForm:
+    # rolling driver and team performance indices for one season. indices
+    # only ever reflect races already ingested with update(), and every team
+    # is pushed once per race with the sum of its drivers' points
+
+    def __init__(self, window=form_window, driver_norm=driver_norm, team_norm=team_norm):
+        self.window = window
+        self.driver_norm = driver_norm
+        self.team_norm = team_norm
+        self.drivers = {}
+        self.teams = {}
+
+    def driver_perf(self, drv_code):
+        hist = self.drivers.get(drv_code)
+        return hist.index(self.driver_norm) if hist else 0.0
+
+    def team_perf(self, team_name):
+        hist = self.teams.get(team_name)
+        return hist.index(self.team_norm) if hist else 0.0
+
+    def update(self, standings):
+        # standings: [(drv_code, team_name, pts), ...] for one race, pts None
+        # for drivers without a result. missing points count as zero
+        team_pts = {}
+        for drv_code, team_name, pts in standings:
+            if pts is None:
+                continue
+            pts = 0.0 if pd.isna(pts) else float(pts)
+            self.drivers.setdefault(drv_code, RollingWindow(self.window)).push(pts)
+            team_pts[team_name] = team_pts.get(team_name, 0.0) + pts
+        for team_name, pts in team_pts.items():
+            self.teams.setdefault(team_name, RollingWindow(self.window)).push(pts)
+
+
+def prior_form(table, key, window, norm):
+    # table holds one row per (race, key) in race order with the points scored
+    # and whether they count. returns the index each row saw before its race
+    counted = table[table["counted"]]
+    groups = [counted["season"], counted[key]]
+    running = counted["points"].groupby(groups).cumsum()
+    post_sum = running - running.groupby(groups).shift(window).fillna(0.0)
+    post_count = (counted.groupby(groups).cumcount() + 1).clip(upper=window)
+
+    post_perf = pd.Series(np.nan, index=table.index)
+    post_perf[counted.index] = post_sum / (post_count * norm)
+    groups = [table["season"], table[key]]
+    seen = post_perf.groupby(groups).ffill()
+    return seen.groupby(groups).shift(1).fillna(0.0)
+
+def compute_history(results, window=form_window, driver_norm=driver_norm, team_norm=team_norm):
+    # vectorized equivalent of feeding every race through RollingForm.
+    # results: one row per driver per race in race order, with race_id,
+    # driver, team and points (NaN for drivers without a result).
+    # returns driver_perf and team_perf aligned with results
+    table = pd.DataFrame({
+        "race_id": results["race_id"].to_numpy(),
+        "season": results["race_id"].astype(str).str[:2].to_numpy(),
+        "driver": results["driver"].to_numpy(),
+        "team": results["team"].to_numpy(),
+        "counted": results["points"].notna().to_numpy() if "counted" not in results
+                   else results["counted"].to_numpy(),
+        "points": results["points"].fillna(0.0).astype(float).to_numpy(),
+    })
+    driver_perf = prior_form(table, "driver", window, driver_norm)
+
+    teams = (table.groupby(["race_id", "season", "team"], sort=False)
+                  .agg(points=("points", "sum"), counted=("counted", "any"))
+                  .reset_index())
+    teams["team_perf"] = prior_form(teams, "team", window, team_norm)
+    team_perf = table.merge(teams[["race_id", "team", "team_perf"]],
+                            on=["race_id", "team"], how="left")["team_perf"]
+
+    return pd.DataFrame({"driver_perf": driver_perf.to_numpy(),
+                         "team_perf": team_perf.to_numpy()}, index=results.index)
@@ -1,8 +1,12 @@
+import argparse
+import json
+import os
+from functools import lru_cache
 import pandas as pd
 from sklearn.preprocessing import StandardScaler
-import joblib   
-
-df = pd.read_csv("datasets/f1_encoded_not_scaled.csv")
+import joblib
+import instrument
+import storage
 
 
 scale_cols = [
@@ -15,10 +19,106 @@ scale_cols = [
     "race_pace"
 ]
 
+# every fit or update is kept as scalers/scaler-{version}.pkl, and
+# scalers/index.json lists the races each version has seen. scaler.pkl is
+# always a copy of the latest version
+scaler_dir = "scalers"
+index_path = os.path.join(scaler_dir, "index.json")
+
+
+def scale(df):
+    df = df.copy()
+    scaler = StandardScaler()
+    df[scale_cols] = scaler.fit_transform(df[scale_cols])
+    return df, scaler
+
+
+def load_index():
+    if not os.path.exists(index_path):
+        return {"latest": None, "versions": []}
+    with open(index_path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_version(scaler, races, added, mode):
+    # writes the scaler as the next version and points the index at it
+    index = load_index()
+    version = (index["latest"] or 0) + 1
+    path = os.path.join(scaler_dir, f"scaler-{version:04d}.pkl")
+    os.makedirs(scaler_dir, exist_ok=True)
+    joblib.dump(scaler, path)
+    index["versions"].append({
+        "version": version,
+        "path": path,
+        "mode": mode,
+        "n_samples_seen": pd.Series(scaler.n_samples_seen_).max().item(),
+        "added": list(added),
+        "races": list(races),
+    })
+    index["latest"] = version
+    tmp_path = f"{index_path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(index, f, indent=1)
+    os.replace(tmp_path, index_path)
+    joblib.dump(scaler, "scaler.pkl")
+    return version
+
+
+@lru_cache(maxsize=8)
+def load_scaler(version=None):
+    # version=None is the latest; cached so per-race transforms don't reload
+    index = load_index()
+    version = index["latest"] if version is None else version
+    if version is None:
+        return joblib.load("scaler.pkl")
+    entry = next(v for v in index["versions"] if v["version"] == version)
+    return joblib.load(entry["path"])
+
+
+def transform_race(df, version=None):
+    # scales the rows of one (or a few) new races with a stored scaler,
+    # without reading the dataset
+    df = df.copy()
+    df[scale_cols] = load_scaler(version).transform(df[scale_cols])
+    return df
+
+
+def update(df, scaled):
+    # partial_fit the latest scaler on races it hasn't seen and scale only
+    # those rows; rows already in `scaled` keep the values they were written with
+    index = load_index()
+    seen = set(index["versions"][-1]["races"])
+    new = df[~df["race_id"].isin(seen)]
+    if new.empty:
+        return scaled, None
+    scaler = load_scaler()
+    scaler.partial_fit(new[scale_cols])
+    added = list(new["race_id"].unique())
+    version = save_version(scaler, list(index["versions"][-1]["races"]) + added, added, "partial")
+    load_scaler.cache_clear()
+
+    new = new.copy()
+    new[scale_cols] = scaler.transform(new[scale_cols])
+    return pd.concat([scaled, new], ignore_index=True), version
+
 
-scaler = StandardScaler()
-df[scale_cols] = scaler.fit_transform(df[scale_cols])
+if __name__ == "__main__":
+    # python scaling.py               -> refit on every race and rescale everything
+    # python scaling.py --incremental -> update the latest scaler with new races only
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--incremental", action="store_true",
+                        help="update the latest scaler with the new races only")
+    incremental = parser.parse_args().incremental
+    df = storage.read_dataset("encoded_not_scaled")
 
-df.to_csv("f1_encoded_scaled.csv", index=False)
+    with instrument.stage("scale", rows_in=len(df), incremental=incremental) as record:
+        if incremental and load_index()["latest"] is not None:
+            df, version = update(df, storage.read_dataset("encoded_scaled"))
+            print("scaler version:", version or load_index()["latest"], "(unchanged)" if version is None else "")
+        else:
+            df, scaler = scale(df)
+            version = save_version(scaler, df["race_id"].unique(), df["race_id"].unique(), "full")
+            print("scaler version:", version)
+        record["rows_out"] = len(df)
 
-joblib.dump(scaler, "scaler.pkl")
+    storage.write_dataset(df, "encoded_scaled")
@@ -0,0 +1,79 @@
+import pandas as pd
+
+# dtypes shared by every stage: categoricals for ids, tracks and weather,
+# nullable int8 for positions and encodings, float32 for lap times and
+# indices. apply() casts a frame loaded with default inference
+
+weather = pd.CategoricalDtype(["dry", "rainy", "unknown"])
+
+# tyre stint features from ingestion. they aren't imputed, so they stay NaN
+# where a session had no usable stints (or was cached without stint data)
+stint_columns = ["fp1_deg", "fp2_deg", "fp3_deg",
+                 "race_deg", "race_stint_length", "race_stops", "race_pit_loss"]
+
+raw = {
+    "race_id": "category",
+    "fp1_long_run": "float32", "fp2_long_run": "float32", "fp3_long_run": "float32",
+    "race_pace": "float32",
+    "fp1_weather": weather, "fp2_weather": weather, "fp3_weather": weather,
+    "qualifying_weather": weather, "race_weather": weather,
+    "qualifying": "Int8", "finishing_position": "Int8",
+    "driver_perf": "float32", "team_perf": "float32",
+    "track_type": "category",
+    **{col: "float32" for col in stint_columns},
+}
+
+# column order of the all_drivers csvs, as ingestion writes them
+raw_columns = [
+    "race_id",
+    "fp1_long_run", "fp1_weather",
+    "fp2_long_run", "fp2_weather",
+    "fp3_long_run", "fp3_weather",
+    "qualifying", "qualifying_weather",
+    "driver_perf", "team_perf",
+    "track_type", "race_weather",
+    "race_pace", "finishing_position",
+    *stint_columns,
+]
+
+encoded = {
+    **raw,
+    **{col: "Int8" for col, dtype in raw.items() if dtype is weather},
+    "track_environment": "Int8", "setup_demand": "Int8", "track_length": "float32",
+    "relative_qualifying": "float32", "relative_finish": "float32",
+}
+
+encoded_columns = [
+    "race_id",
+    "fp1_weather",
+    "fp2_weather",
+    "fp3_weather",
+    "qualifying_weather",
+    "race_weather",
+    "track_environment",
+    "setup_demand",
+    "track_length",
+    "driver_perf",
+    "team_perf",
+    "fp1_long_run",
+    "fp2_long_run",
+    "fp3_long_run",
+    "race_pace",
+    "relative_qualifying",
+    "relative_finish",
+]
+
+def dtypes_for(name):
+    return encoded if name.startswith("encoded") else raw
+
+def apply(df, name, float_dtype="float32"):
+    # float_dtype="float64" keeps full precision for stages whose output is
+    # persisted, while still getting the categorical/int8 columns
+    types = {col: (float_dtype if dtype == "float32" else dtype)
+             for col, dtype in dtypes_for(name).items() if col in df.columns}
+    return df.astype(types)
+
+def encode(values, categories):
+    # integer codes in the order of `categories`; anything else becomes NA
+    codes = pd.Series(values, copy=False).astype(pd.CategoricalDtype(categories)).cat.codes
+    return codes.astype("Int8").mask(codes < 0)
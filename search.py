@@ -0,0 +1,244 @@
+import argparse
+import json
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+import lightgbm as lgb
+import xgboost as xgb
+import backtest
+import metrics
+import ranker
+
+# hyperparameter search for the boosters. candidates are sampled from the
+# spaces below and trained in a process pool with early stopping on a
+# validation block (the races just before the held-out test races). after
+# every rung of successive halving only the best 1/eta survive and get eta
+# times more boosting rounds. each worker gets cpu_count // workers threads
+# so LightGBM/XGBoost don't oversubscribe the cores. the rankers train on
+# relevance = race size - rank_label, so the winner is the most relevant
+# driver, and stop early on the selection metric from metrics.py, which gets
+# their negated scores (smaller = better finish, like every other model)
+
+out_dir = "models/search"
+
+lgb_space = {
+    "learning_rate": [0.01, 0.02, 0.05, 0.1],
+    "num_leaves": [7, 15, 31, 63],
+    "min_child_samples": [5, 10, 20, 40],
+    "feature_fraction": [0.6, 0.8, 1.0],
+    "bagging_fraction": [0.7, 0.9, 1.0],
+    "lambda_l2": [0.0, 1.0, 10.0],
+}
+
+xgb_space = {
+    "eta": [0.01, 0.02, 0.05, 0.1],
+    "max_depth": [3, 4, 6, 8],
+    "min_child_weight": [1, 5, 10],
+    "subsample": [0.7, 0.9, 1.0],
+    "colsample_bytree": [0.6, 0.8, 1.0],
+    "lambda": [1.0, 5.0, 10.0],
+}
+
+# name -> (library, fixed params, space, uses the ranking labels)
+search_models = {
+    "lgb_ranker": ("lightgbm", {"objective": "lambdarank", "metric": "None"}, lgb_space, True),
+    "xgb_ranker": ("xgboost", {"objective": "rank:pairwise", "disable_default_eval_metric": 1}, xgb_space, True),
+    "lgb_regressor": ("lightgbm", {"objective": "regression", "metric": "l2"}, lgb_space, False),
+    "xgb_regressor": ("xgboost", {"objective": "reg:squarederror", "eval_metric": "rmse"}, xgb_space, False),
+}
+
+# set in every worker by init_worker, so the matrices are sent once per
+# process instead of once per candidate
+_data = {}
+_threads = 1
+
+
+def init_worker(data, threads):
+    global _data, _threads
+    _data, _threads = data, threads
+    os.environ["OMP_NUM_THREADS"] = str(threads)
+
+
+def split_data(n_test, n_valid):
+    # train / valid / test blocks as contiguous row ranges of the shared matrices
+    encoded, scaled = backtest.load()
+    races, bounds = backtest.race_bounds(encoded["race_id"])
+    if n_test + n_valid >= len(races):
+        raise ValueError(f"only {len(races)} races for {n_valid} validation and {n_test} test races")
+    valid_start, test_start = len(races) - n_test - n_valid, len(races) - n_test
+    rank_label = (encoded.groupby("race_id", observed=True, sort=False)["relative_finish"]
+                  .rank(method="first").to_numpy(np.int32))
+    return {
+        "X_rank": encoded[backtest.feature_cols].to_numpy(np.float32, na_value=np.nan),
+        "X_scaled": scaled[backtest.feature_cols].to_numpy(np.float32, na_value=np.nan),
+        "rank_label": rank_label,
+        "relative_finish": scaled["relative_finish"].to_numpy(np.float32),
+        "race_ids": encoded["race_id"].astype(str).to_numpy(),
+        "groups": np.diff(bounds),
+        "blocks": {
+            "train": (0, bounds[valid_start], 0, valid_start),
+            "valid": (bounds[valid_start], bounds[test_start], valid_start, test_start),
+            "test": (bounds[test_start], bounds[-1], test_start, len(races)),
+        },
+    }
+
+
+def block(name, block_name, data):
+    lo, hi, race_lo, race_hi = data["blocks"][block_name]
+    ranking = search_models[name][3]
+    X = data["X_rank"] if ranking else data["X_scaled"]
+    y = data["rank_label"] if ranking else data["relative_finish"]
+    return X[lo:hi], y[lo:hi], data["groups"][race_lo:race_hi], data["race_ids"][lo:hi]
+
+
+def relevance(rank_label, groups):
+    # the winner (rank_label 1) gets size - 1, last place 0
+    return np.repeat(groups, groups) - rank_label
+
+
+def finish_scores(name, pred):
+    # the rankers score the winner highest; metrics.py wants smaller = better
+    return -pred if search_models[name][3] else pred
+
+
+def sample_candidates(name, n, seed):
+    space = search_models[name][2]
+    rng = np.random.default_rng(seed)
+    candidates = []
+    for _ in range(n * 20):
+        params = {key: values[rng.integers(len(values))] for key, values in space.items()}
+        params = {k: (v.item() if isinstance(v, np.generic) else v) for k, v in params.items()}
+        if params not in candidates:
+            candidates.append(params)
+        if len(candidates) == n:
+            break
+    return candidates
+
+
+def train_candidate(name, params, rounds, patience, metric, keep_model=False):
+    # trains one config for up to `rounds` with early stopping on the
+    # validation races; returns its validation score (mean per-race metric)
+    library, fixed, _, ranking = search_models[name]
+    X_train, y_train, g_train, _ = block(name, "train", _data)
+    X_valid, y_valid, g_valid, ids_valid = block(name, "valid", _data)
+    X_test, _, _, _ = block(name, "test", _data)
+    actual = y_valid
+    valid_score = lambda pred: float(metrics.evaluate(ids_valid, actual, {name: finish_scores(name, pred)})[metric].mean())
+    if ranking:
+        y_train, y_valid = relevance(y_train, g_train), relevance(y_valid, g_valid)
+
+    if library == "lightgbm":
+        extra = {"bagging_freq": 1} if params.get("bagging_fraction", 1.0) < 1.0 else {}
+        dtrain = lgb.Dataset(X_train, y_train, group=g_train if ranking else None)
+        dvalid = lgb.Dataset(X_valid, y_valid, group=g_valid if ranking else None, reference=dtrain)
+        feval = (lambda pred, _: (metric, valid_score(pred), True)) if ranking else None
+        booster = lgb.train({**fixed, **params, **extra, "num_threads": _threads, "verbose": -1},
+                            dtrain, num_boost_round=rounds, valid_sets=[dvalid], feval=feval,
+                            callbacks=[lgb.early_stopping(patience, verbose=False)])
+        best_iteration = booster.best_iteration or rounds
+        predict = lambda X: booster.predict(X, num_iteration=best_iteration)
+        model = booster.model_to_string(num_iteration=best_iteration) if keep_model else None
+    else:
+        dtrain = xgb.DMatrix(X_train, label=y_train, nthread=_threads)
+        dvalid = xgb.DMatrix(X_valid, label=y_valid, nthread=_threads)
+        if ranking:
+            dtrain.set_group(g_train)
+            dvalid.set_group(g_valid)
+        custom_metric = (lambda pred, _: (metric, valid_score(pred))) if ranking else None
+        booster = xgb.train({**fixed, **params, "nthread": _threads}, dtrain, num_boost_round=rounds,
+                            evals=[(dvalid, "valid")], early_stopping_rounds=patience, verbose_eval=False,
+                            custom_metric=custom_metric, maximize=ranking)
+        best_iteration = booster.best_iteration + 1
+        predict = lambda X: booster.predict(xgb.DMatrix(X, nthread=_threads), iteration_range=(0, best_iteration))
+        model = bytes(booster.save_raw("json")) if keep_model else None
+
+    return {
+        "score": valid_score(predict(X_valid)),
+        "best_iteration": int(best_iteration),
+        "test_pred": finish_scores(name, predict(X_test)) if keep_model else None,
+        "model": model,
+    }
+
+
+def successive_halving(pool, name, candidates, min_rounds, max_rounds, eta, patience, metric):
+    # every rung trains the survivors with eta times more rounds and keeps
+    # the best 1/eta of them; the last rung keeps its models
+    history = [{"params": params, "rungs": []} for params in candidates]
+    alive = list(range(len(candidates)))
+    rounds = min_rounds
+    while True:
+        last = len(alive) <= eta or rounds >= max_rounds
+        rounds = min(rounds, max_rounds)
+        futures = [pool.submit(train_candidate, name, candidates[i], rounds, patience, metric, last)
+                   for i in alive]
+        results = [f.result() for f in futures]
+        for i, result in zip(alive, results):
+            history[i]["rungs"].append({"rounds": rounds, "score": result["score"],
+                                        "best_iteration": result["best_iteration"]})
+        # every metric in metrics.py is "higher is better"
+        order = np.argsort([-r["score"] for r in results], kind="stable")
+        if last:
+            best = alive[order[0]]
+            return best, results[order[0]], history
+        alive = [alive[j] for j in order[:max(1, math.ceil(len(alive) / eta))]]
+        print(f"{name}: {len(alive)} configs left after {rounds} rounds")
+        rounds *= eta
+
+
+def save_best(name, params, result, history, data):
+    os.makedirs(out_dir, exist_ok=True)
+    library = search_models[name][0]
+    path = os.path.join(out_dir, f"{name}.{'txt' if library == 'lightgbm' else 'json'}")
+    mode = "w" if library == "lightgbm" else "wb"
+    with open(path, mode) as f:
+        f.write(result["model"])
+
+    _, y_test, _, ids_test = block(name, "test", data)
+    scores = metrics.evaluate(ids_test, y_test, {name: result["test_pred"]})
+    scores.to_csv(os.path.join(out_dir, f"{name}_scores.csv"), index=False)
+
+    with open(os.path.join(out_dir, f"{name}_search.json"), "w", encoding="utf-8") as f:
+        json.dump({"params": params, "best_iteration": result["best_iteration"],
+                   "valid_score": result["score"], "candidates": history}, f, indent=1)
+    return path, scores
+
+
+def search(names, n_candidates=27, workers=None, min_rounds=50, max_rounds=1350, eta=3,
+           patience=30, metric="ndcg", n_test=ranker.n_test, n_valid=19, seed=0):
+    workers = workers or os.cpu_count() or 1
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    data = split_data(n_test, n_valid)
+    results = {}
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(data, threads)) as pool:
+        for name in names:
+            candidates = sample_candidates(name, n_candidates, seed)
+            best, result, history = successive_halving(pool, name, candidates, min_rounds, max_rounds,
+                                                       eta, patience, metric)
+            path, scores = save_best(name, candidates[best], result, history, data)
+            results[name] = scores
+            print(f"{name}: best {candidates[best]} at {result['best_iteration']} rounds, "
+                  f"valid {metric} {result['score']:.4f}, saved to {path}")
+    return pd.concat(results.values(), ignore_index=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--models", nargs="+", choices=list(search_models), default=list(search_models))
+    parser.add_argument("--candidates", type=int, default=27, help="configs sampled per model")
+    parser.add_argument("--workers", type=int, help="processes, default one per core")
+    parser.add_argument("--min-rounds", type=int, default=50, help="boosting rounds in the first rung")
+    parser.add_argument("--max-rounds", type=int, default=1350)
+    parser.add_argument("--eta", type=int, default=3, help="keep 1/eta of the configs per rung")
+    parser.add_argument("--patience", type=int, default=30, help="early stopping rounds")
+    parser.add_argument("--metric", choices=metrics.metric_cols, default="ndcg",
+                        help="mean per-race validation metric to select on")
+    parser.add_argument("--valid-races", type=int, default=19)
+    parser.add_argument("--test-races", type=int, default=ranker.n_test)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    scores = search(args.models, args.candidates, args.workers, args.min_rounds, args.max_rounds,
+                    args.eta, args.patience, args.metric, args.test_races, args.valid_races, args.seed)
+    print(metrics.summary(scores).to_string())
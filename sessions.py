@@ -0,0 +1,240 @@
+import asyncio
+import io
+import os
+import urllib.error
+import urllib.request
+import fastf1
+import pandas as pd
+import instrument
+
+# what each session type is loaded with. getData only uses laps, results and
+# weather, so telemetry/position data and race-control messages are skipped,
+# and qualifying only feeds positions so its laps are skipped too
+load_profiles = {
+    'R':   dict(laps=True,  telemetry=False, weather=True, messages=False),
+    'FP1': dict(laps=True,  telemetry=False, weather=True, messages=False),
+    'FP2': dict(laps=True,  telemetry=False, weather=True, messages=False),
+    'FP3': dict(laps=True,  telemetry=False, weather=True, messages=False),
+    'S':   dict(laps=True,  telemetry=False, weather=True, messages=False),
+    'Q':   dict(laps=False, telemetry=False, weather=True, messages=False),
+}
+
+session_types = list(load_profiles)
+
+# session types a weekend of each format doesn't have (2021-22 sprint
+# weekends still had FP2); an unknown format assumes every session exists
+absent_sessions = {
+    'conventional': {'S'},
+    'sprint': {'FP3'},
+    'sprint_shootout': {'FP2', 'FP3'},
+    'sprint_qualifying': {'FP2', 'FP3'},
+}
+
+# where summaries are cached, and where recorded sessions are replayed from
+# instead of FastF1 when set: a fixture folder or the url of replay.py serve
+summary_dir = os.environ.get("F1_SUMMARY_DIR", "cache/summaries")
+replay_dir = os.environ.get("F1_REPLAY_DIR")
+
+
+# network-level errors worth retrying; anything else (no such session)
+# fails the session straight away
+transient_errors = (ConnectionError, TimeoutError, urllib.error.URLError)
+try:
+    import requests
+    transient_errors += (requests.ConnectionError, requests.Timeout)
+except ImportError:
+    pass
+
+# laps keep the stint columns too, for features.stint_features
+lap_cols = ['Driver', 'LapTime', 'LapNumber', 'Stint', 'Compound', 'PitInTime', 'PitOutTime']
+result_cols = ['Abbreviation', 'TeamName', 'Position', 'Points']
+
+
+class SessionSummary:
+    # compact stand-in for a loaded fastf1 session: keeps only what getData
+    # reads and exposes it under the same names, so features can be rebuilt
+    # (e.g. with a different long-run window) without re-parsing the session.
+    # fastf1 only logs the parts that fail to load, so those are left None and
+    # listed in `missing`; the rest of the session stays usable
+
+    # summaries cached before parts were checked
+    missing = ()
+
+    def __init__(self, event, drivers, driver_info, laps, results, weather_data):
+        self.event = event
+        self.drivers = drivers
+        self.driver_info = driver_info
+        self._laps = laps
+        self._results = results
+        self._weather_data = weather_data
+
+    @staticmethod
+    def _loaded(value, name):
+        if value is None:
+            raise ValueError(f"{name} not available for this session")
+        return value
+
+    @property
+    def laps(self):
+        return self._loaded(self._laps, "laps")
+
+    @property
+    def results(self):
+        return self._loaded(self._results, "results")
+
+    @property
+    def weather_data(self):
+        return self._loaded(self._weather_data, "weather data")
+
+    def get_driver(self, drv):
+        return self.driver_info[drv]
+
+    def missing_parts(self, profile):
+        # the parts the load profile asked for that didn't load
+        parts = {'results': self._results}
+        if profile.get('laps'):
+            parts['laps'] = self._laps
+        if profile.get('weather'):
+            parts['weather'] = self._weather_data
+        return [name for name, value in parts.items() if value is None]
+
+    @classmethod
+    def from_session(cls, session):
+        def part(get):
+            try:
+                return get()
+            except Exception:
+                return None
+
+        drivers = list(part(lambda: session.drivers) or [])
+        driver_info = {}
+        for drv in drivers:
+            info = part(lambda: session.get_driver(drv))
+            if info is not None:
+                driver_info[drv] = pd.Series({
+                    'Abbreviation': info.get('Abbreviation', "UNK"),
+                    'TeamName': info.get('TeamName', "UNK"),
+                })
+
+        laps = part(lambda: pd.DataFrame(session.laps[[c for c in lap_cols if c in session.laps.columns]])
+                    .reset_index(drop=True))
+        results = part(lambda: pd.DataFrame(session.results[result_cols]).reset_index(drop=True))
+        weather_data = part(lambda: pd.DataFrame(session.weather_data[['Rainfall']]).reset_index(drop=True))
+        event = pd.Series({
+            'EventName': session.event.get('EventName', "unknown"),
+            'EventFormat': session.event.get('EventFormat', ""),
+        })
+        return cls(event, drivers, driver_info, laps, results, weather_data)
+
+
+class ReplaySession:
+    # serves a recorded summary through the fastf1 session interface
+
+    def __init__(self, path):
+        self.path = path
+        self.summary = None
+
+    def load(self, **kwargs):
+        if self.path.startswith(("http://", "https://")):
+            try:
+                with urllib.request.urlopen(self.path, timeout=30) as response:
+                    self.summary = pd.read_pickle(io.BytesIO(response.read()))
+            except urllib.error.HTTPError as e:
+                if e.code == 404:
+                    raise ValueError(f"no recording at {self.path}") from e
+                raise
+            return
+        if not os.path.exists(self.path):
+            raise ValueError(f"no recording at {self.path}")
+        self.summary = pd.read_pickle(self.path)
+
+    def __getattr__(self, name):
+        summary = self.__dict__.get("summary")
+        if summary is None:
+            raise AttributeError(f"{name}: session not loaded")
+        return getattr(summary, name)
+
+
+def entrants(session):
+    # (driver codes, team names) in the session's driver order, "UNK" for
+    # drivers without info; the rows of a race in the datasets follow it
+    drv_codes, team_names = [], []
+    for drv in getattr(session, "drivers", []):
+        try:
+            drv_info = session.get_driver(drv)
+            drv_codes.append(drv_info.get('Abbreviation', "UNK"))
+            team_names.append(drv_info.get('TeamName', "UNK"))
+        except Exception:
+            drv_codes.append("UNK")
+            team_names.append("UNK")
+    return drv_codes, team_names
+
+def get_session(year, rnd, stype):
+    if replay_dir:
+        return ReplaySession(f"{replay_dir.rstrip('/')}/{year}/{rnd:02d}_{stype}.pkl")
+    return fastf1.get_session(year, rnd, stype)
+
+def summary_path(year, rnd, stype):
+    return f"{summary_dir}/{year}/{rnd:02d}_{stype}.pkl"
+
+def fetch_summary(year, rnd, stype):
+    # cached summary if there is one, otherwise load the session with its
+    # lean profile and cache the summary. raises when the load fails; a
+    # session with only some of the profile's parts is cached as it is
+    path = summary_path(year, rnd, stype)
+    with instrument.span("session", year=year, round=rnd, session=stype) as record:
+        record["cached"] = os.path.exists(path)
+        if record["cached"]:
+            summary = pd.read_pickle(path)
+            if summary.missing:
+                record["missing"] = list(summary.missing)
+            return summary
+        session = get_session(year, rnd, stype)
+        session.load(**load_profiles[stype])
+
+        summary = SessionSummary.from_session(session)
+        summary.missing = summary.missing_parts(load_profiles[stype])
+        if summary.missing:
+            record["missing"] = summary.missing
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        pd.to_pickle(summary, tmp_path)
+        os.replace(tmp_path, path)
+        return summary
+
+def load_summary(year, rnd, stype):
+    # fetch_summary, or None when the session is unavailable
+    try:
+        return fetch_summary(year, rnd, stype)
+    except Exception:
+        return None
+
+async def load_weekend(year, rnd, stypes=session_types, concurrency=3, retries=3, backoff=1.0):
+    # load the sessions of one weekend concurrently, at most `concurrency`
+    # at a time, retrying transient errors with exponential backoff.
+    # returns ({stype: summary or None}, {stype: reason} for failed sessions);
+    # sessions the weekend's format doesn't have aren't failures
+    semaphore = asyncio.Semaphore(concurrency)
+    failures = {}
+
+    async def load(stype):
+        for attempt in range(retries + 1):
+            async with semaphore:
+                try:
+                    return await asyncio.to_thread(fetch_summary, year, rnd, stype)
+                except transient_errors as e:
+                    error = e
+                except Exception as e:
+                    failures[stype] = f"{type(e).__name__}: {e}"
+                    return None
+            if attempt < retries:
+                await asyncio.sleep(backoff * 2 ** attempt)
+        failures[stype] = f"{type(error).__name__} after {retries + 1} attempts: {error}"
+        return None
+
+    summaries = await asyncio.gather(*(load(stype) for stype in stypes))
+    loaded = dict(zip(stypes, summaries))
+    event_format = next((summary.event.get('EventFormat', "") for summary in summaries if summary is not None), "")
+    for stype in absent_sessions.get(event_format, ()):
+        failures.pop(stype, None)
+    return loaded, failures
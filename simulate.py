@@ -0,0 +1,105 @@
+import argparse
+import json
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+# monte carlo race simulation on top of model scores. a driver's score is
+# standardized within the race (smaller = faster, whatever the model), and
+# every simulated race adds gaussian noise, random retirements and, with
+# some probability, a safety car that compresses the field so the noise
+# matters more. races are simulated in batches of whole arrays, and the
+# finishing positions are counted straight into a driver x position table
+
+defaults = {
+    "noise": 1.0,           # sd of the per-race performance noise, in score sds
+    "dnf_rate": 0.08,       # chance that each driver retires
+    "sc_rate": 0.5,         # chance of a safety car during the race
+    "sc_compression": 0.5,  # gaps are multiplied by this under a safety car
+}
+
+
+def standardize(scores):
+    scores = np.asarray(scores, dtype=float)
+    std = scores.std()
+    return (scores - scores.mean()) / std if std > 0 else np.zeros_like(scores)
+
+
+def position_counts(scores, n_sims=50000, batch_size=10000, seed=0, noise=defaults["noise"],
+                    dnf_rate=defaults["dnf_rate"], sc_rate=defaults["sc_rate"],
+                    sc_compression=defaults["sc_compression"]):
+    # returns counts[driver, position - 1] over n_sims races; dnf_rate can
+    # also be one rate per driver
+    rng = np.random.default_rng(seed)
+    pace = standardize(scores)
+    n = len(pace)
+    dnf_rate = np.broadcast_to(np.asarray(dnf_rate, dtype=float), (n,))
+    counts = np.zeros(n * n, dtype=np.int64)
+    slots = np.arange(n)
+
+    for start in range(0, n_sims, batch_size):
+        size = min(batch_size, n_sims - start)
+        gap = np.where(rng.random(size) < sc_rate, sc_compression, 1.0)[:, None]
+        perf = pace * gap + noise * rng.standard_normal((size, n))
+        # retirements go behind every finisher, in random order among themselves
+        retired = rng.random((size, n)) < dnf_rate
+        perf = np.where(retired, 1e9 + rng.random((size, n)), perf)
+        order = np.argsort(perf, axis=1)
+        counts += np.bincount((order * n + slots).ravel(), minlength=n * n)
+
+    return counts.reshape(n, n)
+
+
+def simulate(drivers, scores, n_sims=50000, **params):
+    # per-driver P(win), P(podium), expected position and the full
+    # position distribution (columns p1..pN), best expected position first
+    counts = position_counts(scores, n_sims, **params)
+    probs = counts / n_sims
+    n = len(drivers)
+    positions = np.arange(1, n + 1)
+    result = pd.DataFrame({
+        "driver": list(drivers),
+        "score": np.asarray(scores, dtype=float),
+        "p_win": probs[:, 0],
+        "p_podium": probs[:, :3].sum(axis=1),
+        "expected_position": probs @ positions,
+    })
+    distribution = pd.DataFrame(probs, columns=[f"p{p}" for p in positions])
+    return pd.concat([result, distribution], axis=1).sort_values("expected_position", ignore_index=True)
+
+
+def simulate_race(predictor, race, model=None, n_sims=50000, **params):
+    # scores a race with a trained model (see predict.py) and simulates it
+    prediction = predictor.predict_race(race, model)
+    return simulate(prediction["order"], prediction["scores"], n_sims, **params)
+
+
+if __name__ == "__main__":
+    import predict
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("race", help="json file with one race as predict.py takes it, - for stdin")
+    parser.add_argument("--model", help="model from models/index.json")
+    parser.add_argument("--sims", type=int, default=50000)
+    parser.add_argument("--batch-size", type=int, default=10000)
+    parser.add_argument("--noise", type=float, default=defaults["noise"])
+    parser.add_argument("--dnf-rate", type=float, default=defaults["dnf_rate"])
+    parser.add_argument("--sc-rate", type=float, default=defaults["sc_rate"])
+    parser.add_argument("--sc-compression", type=float, default=defaults["sc_compression"])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--distribution", action="store_true", help="also print every position's probability")
+    args = parser.parse_args()
+
+    with (sys.stdin if args.race == "-" else open(args.race, encoding="utf-8")) as f:
+        race = json.load(f)
+
+    start = time.perf_counter()
+    result = simulate_race(predict.Predictor(), race, args.model, args.sims, batch_size=args.batch_size,
+                           seed=args.seed, noise=args.noise, dnf_rate=args.dnf_rate,
+                           sc_rate=args.sc_rate, sc_compression=args.sc_compression)
+    elapsed = time.perf_counter() - start
+
+    columns = None if args.distribution else ["driver", "score", "p_win", "p_podium", "expected_position"]
+    print(result.to_string(columns=columns, index=False, float_format=lambda x: f"{x:.3f}"))
+    print(f"{args.sims} races in {elapsed:.2f} s", file=sys.stderr)
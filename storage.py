@@ -0,0 +1,119 @@
+import argparse
+import glob
+import os
+import re
+import pandas as pd
+import schema
+
+# "csv" reads and writes the original files. "parquet" and "feather" store
+# every dataset as one file per season under datasets/{name}/, with the
+# dtypes from schema.py, so a stage only reads the seasons and columns it needs.
+# a dataset without any partitions yet is read from its csvs;
+# python storage.py convert writes the partitions from them
+backend = os.environ.get("F1_STORAGE", "csv")
+
+csv_paths = {
+    "all_drivers": "datasets/f1_{season}_all_drivers.csv",
+    "preprocessed": "datasets/f1_all_years_preprocessed.csv",
+    "encoded_not_scaled": "datasets/f1_encoded_not_scaled.csv",
+    "encoded_scaled": "datasets/f1_encoded_scaled.csv",
+}
+
+def season_of(race_ids):
+    return 2000 + race_ids.astype(str).str[:2].astype(int)
+
+def partition_paths(name, seasons=None):
+    paths = sorted(glob.glob(f"datasets/{name}/season=*.{backend}"))
+    if seasons is not None:
+        wanted = {int(season) for season in seasons}
+        paths = [p for p in paths if int(re.search(r"season=(\d+)", p).group(1)) in wanted]
+    return paths
+
+def dataset_files(name, seasons=None):
+    # the files currently backing a dataset, e.g. to hash a stage's inputs
+    if backend != "csv" and partition_paths(name):
+        return partition_paths(name, seasons)
+    return csv_files(name, seasons)
+
+def csv_files(name, seasons=None):
+    if "{season}" not in csv_paths[name]:
+        return [csv_paths[name]] if os.path.exists(csv_paths[name]) else []
+    if seasons is None:
+        return sorted(glob.glob(csv_paths[name].format(season="*")))
+    return [csv_paths[name].format(season=season) for season in seasons]
+
+def read_dataset(name, columns=None, seasons=None, compact=False, float_dtype="float32"):
+    # compact=True returns the schema dtypes whatever the backend
+    df = read_raw(name, columns, seasons)
+    return schema.apply(df, name, float_dtype) if compact else df
+
+def read_raw(name, columns=None, seasons=None):
+    if backend == "csv" or not partition_paths(name):
+        return read_csv(name, columns, seasons)
+
+    read = pd.read_parquet if backend == "parquet" else pd.read_feather
+    frames = [read(p, columns=columns) for p in partition_paths(name, seasons)]
+    return pd.concat(frames, ignore_index=True)
+
+def read_csv(name, columns=None, seasons=None):
+    # csv floats are parsed round-trip exact, so a dataset that is read and
+    # rewritten (e.g. by an incremental stage) keeps its existing values
+    if "{season}" in csv_paths[name]:
+        paths = csv_files(name, seasons)
+        df = pd.concat([pd.read_csv(p, usecols=columns, float_precision="round_trip") for p in paths], ignore_index=True)
+    else:
+        df = pd.read_csv(csv_paths[name], usecols=columns, float_precision="round_trip")
+        if seasons is not None:
+            df = df[season_of(df["race_id"]).isin(seasons)].reset_index(drop=True)
+    return df if columns is None else df[columns]
+
+def write_dataset(df, name, seasons=None):
+    # seasons limits a columnar write to those partitions, for stages that
+    # only produced some seasons (e.g. one year of getData)
+    if backend == "csv":
+        if "{season}" in csv_paths[name]:
+            for season, part in df.groupby(season_of(df["race_id"])):
+                part.to_csv(csv_paths[name].format(season=season), index=False)
+        else:
+            df.to_csv(csv_paths[name], index=False)
+        return
+
+    df = schema.apply(df, name)
+    os.makedirs(f"datasets/{name}", exist_ok=True)
+    if seasons is None:
+        for path in partition_paths(name):
+            os.remove(path)
+    for season, part in df.groupby(season_of(df["race_id"])):
+        if seasons is not None and season not in seasons:
+            continue
+        part = part.reset_index(drop=True)
+        path = f"datasets/{name}/season={season}.{backend}"
+        if backend == "parquet":
+            part.to_parquet(path, index=False)
+        else:
+            part.to_feather(path)
+
+def convert(names):
+    # writes the backend's partitions of every dataset from its csvs
+    for name in names:
+        if not csv_files(name):
+            print(f"{name}: no csv, skipped")
+            continue
+        df = read_csv(name)
+        write_dataset(df, name)
+        print(f"{name}: {len(df)} rows → datasets/{name}/")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("mode", choices=["convert"],
+                        help="convert: write the F1_STORAGE backend's partitions from the csvs")
+    parser.add_argument("names", nargs="*", help=f"datasets to convert (default: all of {', '.join(csv_paths)})")
+    args = parser.parse_args()
+
+    unknown = sorted(set(args.names) - set(csv_paths))
+    if unknown:
+        parser.error(f"unknown datasets: {', '.join(unknown)}")
+    if backend == "csv":
+        parser.error("set F1_STORAGE=parquet or feather to convert")
+    convert(args.names or list(csv_paths))
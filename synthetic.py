@@ -0,0 +1,142 @@
+import argparse
+import math
+import os
+import numpy as np
+import pandas as pd
+import rolling
+import schema
+import storage
+import tracks
+
+# made-up seasons in the all_drivers schema, for benchmarking the stages
+# after ingestion at sizes the real data doesn't reach. scale=1 is about the
+# size of the real dataset (147 races); more races become more seasons and
+# then more series. a series is a separate grid with its own drivers and
+# teams, and its rounds are numbered from series*100, e.g. race "19-105"
+# is round 5 of series 1 in 2019. missing values and "unknown" weather
+# appear at roughly the real rates so the imputer has work to do. stint
+# features follow the long runs and race pace they come from
+
+base_races = 147
+points = np.array([25, 18, 15, 12, 10, 8, 6, 4, 2, 1], dtype=float)
+
+
+def race_table(n_races, rounds, start_year):
+    seasons = min(math.ceil(n_races / rounds), 99 - start_year % 100)
+    i = np.arange(n_races)
+    series, season, rnd = i // (seasons * rounds), (i // rounds) % seasons, i % rounds + 1
+    race_ids = [f"{start_year % 100 + s:02d}-{k * 100 + r:02d}" for k, s, r in zip(series, season, rnd)]
+    return np.array(race_ids), series, rnd
+
+
+def weather(rng, shape, rain, unknown=0.01):
+    # per-race rain probability, with a few sessions unknown
+    values = np.where(rng.random(shape) < rain, "rainy", "dry").astype(object)
+    values[rng.random(shape) < unknown] = "unknown"
+    return values
+
+
+def generate(scale=1.0, grid_size=22, rounds=24, seed=0, start_year=2018):
+    rng = np.random.default_rng(seed)
+    n_races = max(1, round(base_races * scale))
+    race_ids, series, rnd = race_table(n_races, rounds, start_year)
+    shape = (n_races, grid_size)
+
+    # every series has its own grid: two drivers per team, a car pace that
+    # drifts a little from race to race
+    teams = np.arange(grid_size) // 2
+    car = rng.normal(0, 0.6, (series.max() + 1, grid_size))[series]
+    car += np.cumsum(rng.normal(0, 0.02, shape), axis=0)
+
+    # a fixed calendar per series, so every track comes back each season
+    # (the imputer's nearest neighbours are searched per track)
+    events = tracks.load_registry().index.to_numpy()
+    calendars = np.array([rng.choice(events, rounds, replace=len(events) < rounds)
+                          for _ in range(series.max() + 1)])
+    track = calendars[series, rnd - 1]
+    base_lap = rng.uniform(70, 105, n_races)[:, None]
+    sprint = rng.random(n_races) < 0.15
+    rain = np.where(rng.random(n_races) < 0.25, 0.8, 0.05)[:, None]
+
+    def long_run(missing):
+        laps = base_lap + car + rng.exponential(1.5, shape)
+        return np.where(rng.random(shape) < missing, np.nan, laps)
+
+    fp1, fp2, fp3 = long_run(0.1), long_run(0.25), long_run(0.45)
+    # sprint weekends have a single practice that everyone runs
+    fp1[sprint] = base_lap[sprint] + car[sprint] + rng.exponential(1.5, (sprint.sum(), grid_size))
+    fp2[sprint], fp3[sprint] = np.nan, np.nan
+    fp_weather = [weather(rng, (n_races, 1), rain) for _ in range(3)]
+    for w in fp_weather[1:]:
+        w[sprint] = np.nan
+    # the sprint practice's weather has no fp2 to fall back on
+    fp_weather[0][sprint] = weather(rng, (sprint.sum(), 1), rain[sprint], unknown=0)
+
+    quali_order = np.argsort(car + rng.normal(0, 0.3, shape), axis=1)
+    qualifying = np.empty(shape)
+    np.put_along_axis(qualifying, quali_order, np.arange(1, grid_size + 1, dtype=float)[None, :], axis=1)
+    finish_order = np.argsort(car + rng.normal(0, 0.8, shape), axis=1)
+    finishing = np.empty(shape)
+    np.put_along_axis(finishing, finish_order, np.arange(1, grid_size + 1, dtype=float)[None, :], axis=1)
+    race_pace = base_lap + 6 + car + rng.exponential(2.0, shape)
+
+    # form from the points the drivers scored, exactly as ingestion does it
+    scored = np.where(finishing <= len(points), points[np.minimum(finishing, len(points)).astype(int) - 1], 0.0)
+    results = pd.DataFrame({
+        "race_id": np.repeat(race_ids, grid_size),
+        "driver": [f"S{s}D{d:02d}" for s in series for d in range(grid_size)],
+        "team": [f"S{s}T{t:02d}" for s in series for t in teams],
+        "points": scored.ravel(),
+    })
+    form = rolling.compute_history(results)
+
+    qualifying[rng.random(shape) < 0.02] = np.nan
+    finishing[rng.random(shape) < 0.001] = np.nan
+    race_pace[rng.random(shape) < 0.025] = np.nan
+    df = pd.DataFrame({
+        "race_id": results["race_id"],
+        "fp1_long_run": fp1.ravel(),
+        "fp1_weather": np.repeat(fp_weather[0].ravel(), grid_size),
+        "fp2_long_run": fp2.ravel(),
+        "fp2_weather": np.repeat(fp_weather[1].ravel(), grid_size),
+        "fp3_long_run": fp3.ravel(),
+        "fp3_weather": np.repeat(fp_weather[2].ravel(), grid_size),
+        "qualifying": qualifying.ravel(),
+        "qualifying_weather": np.repeat(weather(rng, (n_races, 1), rain).ravel(), grid_size),
+        "driver_perf": form["driver_perf"].to_numpy(),
+        "team_perf": form["team_perf"].to_numpy(),
+        "track_type": np.repeat(track, grid_size),
+        "race_weather": np.repeat(weather(rng, (n_races, 1), rain).ravel(), grid_size),
+        "race_pace": race_pace.ravel(),
+        "finishing_position": finishing.ravel(),
+    })
+
+    # drawn last so the columns above don't depend on them. a practice's
+    # degradation is missing with its long run, the race's with its pace
+    deg_rate = rng.uniform(0.03, 0.12, (series.max() + 1, grid_size))[series]
+    for session, laps in zip(["fp1", "fp2", "fp3"], [fp1, fp2, fp3]):
+        deg = deg_rate + rng.normal(0, 0.02, shape)
+        df[f"{session}_deg"] = np.where(np.isnan(laps), np.nan, deg).ravel()
+    finished = ~np.isnan(race_pace)
+    stops = np.where(rng.random(shape) < 0.5, 1.0, 2.0)
+    df["race_deg"] = np.where(finished, deg_rate + rng.normal(0, 0.01, shape), np.nan).ravel()
+    df["race_stint_length"] = np.where(finished, 57 / (stops + 1), np.nan).ravel()
+    df["race_stops"] = np.where(finished, stops, np.nan).ravel()
+    df["race_pit_loss"] = np.where(finished, rng.normal(22, 1.5, shape), np.nan).ravel()
+    return df[schema.raw_columns]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("root", help="directory to write datasets/ into (not the repo, it would "
+                                     "replace the real seasons)")
+    parser.add_argument("--scale", type=float, default=1.0)
+    parser.add_argument("--grid-size", type=int, default=22)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    df = generate(args.scale, args.grid_size, seed=args.seed)
+    os.makedirs(os.path.join(args.root, "datasets"), exist_ok=True)
+    os.chdir(args.root)
+    storage.write_dataset(df, "all_drivers")
+    print(f"{len(df)} rows, {df['race_id'].nunique()} races written to {args.root}/datasets")
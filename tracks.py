@@ -0,0 +1,60 @@
+import os
+from functools import lru_cache
+import pandas as pd
+
+# track metadata keyed by event name. datasets/tracks.csv has one row per
+# circuit layout, with ";"-separated aliases for events that reuse it
+# (e.g. "São Paulo Grand Prix" for Interlagos). a new venue is a new row
+registry_path = os.environ.get("F1_TRACKS", "datasets/tracks.csv")
+
+# category order is the encoding: street=0, hybrid=1, classic=2 and
+# high down force=0, medium down force=1, low down force=2
+environments = pd.CategoricalDtype(["street", "hybrid", "classic"])
+setups = pd.CategoricalDtype(["high down force", "medium down force", "low down force"])
+
+feature_cols = ["track_environment", "setup_demand", "track_length"]
+
+@lru_cache(maxsize=None)
+def load_registry(path=registry_path):
+    # one row per name (event or alias), read and expanded once per process
+    tracks = pd.read_csv(path, keep_default_na=False)
+    tracks["name"] = (tracks["event"] + ";" + tracks["aliases"]).str.split(";")
+    tracks = tracks.explode("name")
+    tracks = tracks[tracks["name"] != ""]
+    if tracks["name"].duplicated().any():
+        raise ValueError(f"{path} lists these names twice: {sorted(tracks.loc[tracks['name'].duplicated(), 'name'])}")
+    return pd.DataFrame({
+        "track_environment": pd.Categorical(tracks["track_environment"], dtype=environments),
+        "setup_demand": pd.Categorical(tracks["setup_demand"], dtype=setups),
+        "track_length": tracks["track_length"].astype(float).to_numpy(),
+    }, index=pd.Index(tracks["name"], name="track_type"))
+
+def unknown_tracks(events, path=registry_path):
+    known = load_registry(path).index
+    names = pd.Series(events, copy=False).astype(object).fillna("<missing>").unique()
+    return sorted(name for name in names if name not in known)
+
+def validate(events, path=registry_path):
+    missing = unknown_tracks(events, path)
+    if missing:
+        raise ValueError(f"unknown tracks {missing}, add them to {path}")
+
+def track_features(events, path=registry_path, encoded=True):
+    # the registry is joined once per distinct event and broadcast back by
+    # category code, so the cost doesn't grow with the number of drivers
+    validate(events, path)
+    events = pd.Series(events, copy=False)
+    cats = events.astype("category")
+    per_event = load_registry(path).loc[cats.cat.categories]
+    feats = per_event.iloc[cats.cat.codes.to_numpy()].set_axis(events.index)
+    if encoded:
+        feats = feats.assign(
+            track_environment=feats["track_environment"].cat.codes.astype("Int8"),
+            setup_demand=feats["setup_demand"].cat.codes.astype("Int8"))
+    return feats
+
+@lru_cache(maxsize=256)
+def lookup(event, path=registry_path):
+    # encoded features of a single event, for encoding one new race
+    row = track_features([event], path).iloc[0]
+    return int(row["track_environment"]), int(row["setup_demand"]), float(row["track_length"])